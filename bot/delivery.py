@@ -0,0 +1,457 @@
+"""
+This module contains the delivery pipeline for outgoing notifications.
+
+Messages are sent by a bounded pool of concurrent senders instead of one by one, so a single slow request does not
+hold up the messages queued behind it. Before sending, a sender takes a token from the buckets enforcing Telegram
+limits: messages per second for the whole bot, messages per second for a single chat and messages per minute for a
+single group. A message rejected with RetryAfter (aiogram) or FloodWait (Telethon) is rescheduled after the time
+requested by Telegram.
+
+The limit for the whole bot applies to all its processes together, so its bucket is kept in the database and every
+process takes tokens from it in small batches.
+
+Classes:
+    - TokenBucket: A token bucket rate limiter.
+    - SharedTokenBucket: A token bucket kept in the database and shared by every process.
+    - RateLimiter: Telegram rate limits shared by every pipeline of the process.
+    - DeliveryJob: A single outgoing request.
+    - DeliveryReport: Outcome and throughput of a pipeline run.
+    - DeliveryPipeline: A pool of concurrent senders.
+    - Digest: Texts collected per chat and sent as one combined message per chat.
+
+Functions:
+    - fan_out(send, destinations, ...): Sends the same request to several chats concurrently.
+
+Attributes:
+    limiter (RateLimiter): The process-wide Telegram rate limiter.
+    delivery (DeliveryPipeline): The process-wide delivery pipeline.
+
+Example:
+    jobs = [DeliveryJob(action=partial(bot.send_message, chat_id=chat_id, text=text), chat_id=chat_id)
+            for chat_id in chat_ids]
+    report = await delivery.deliver(jobs)
+
+    results = await fan_out(send=bot.forward_message,
+                            destinations={chat_id: {"from_chat_id": user_id, "message_id": message_id}
+                                          for chat_id in group_ids})
+"""
+
+
+import asyncio
+import logging
+import time
+from functools import partial
+
+from aiogram.exceptions import TelegramRetryAfter
+from cachetools import TTLCache
+from telethon.errors import FloodWaitError
+
+from bot.settings import (DELIVERY_CONCURRENCY, DELIVERY_MAX_RETRIES, GLOBAL_MESSAGES_PER_SECOND,
+                          CHAT_MESSAGES_PER_SECOND, GROUP_MESSAGES_PER_MINUTE, GLOBAL_TOKEN_BATCH)
+from database.main import DatabaseManager
+
+
+MESSAGE_LENGTH_LIMIT = 4096
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum amount of tokens, i.e. the allowed burst.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = None
+
+    def _refill(self, now: float):
+        if self.updated_at is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_delay(self) -> float:
+        """Returns seconds until a token is available, 0 if it is available now"""
+        self._refill(asyncio.get_running_loop().time())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        """Takes a token, which has to be available according to get_delay"""
+        self.tokens -= 1
+
+    async def acquire(self):
+        """Waits until a token is available and takes it"""
+        while delay := self.get_delay():
+            await asyncio.sleep(delay)
+
+        self.take()
+
+
+class SharedTokenBucket:
+    """
+    A token bucket kept in the database and shared by every process.
+
+    Tokens are taken from the database in batches in one short transaction and spent locally, so not every message
+    waits for the database. Tokens left unspent for a second are dropped, so an idle process does not hold them back
+    from the others. While the database cannot be reached, tokens are taken from a local bucket of the same rate.
+
+    Args:
+        name (str): Name of the bucket in the rate_limits table.
+        rate (float): Tokens added per second.
+        capacity (float): Maximum amount of tokens, i.e. the allowed burst.
+        batch (int): Amount of tokens taken from the database at once.
+    """
+    def __init__(self, name: str, rate: float, capacity: float, batch: int):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.batch = max(1, min(batch, int(capacity)))
+        self.tokens = 0
+        self.taken_at = None
+        self.fallback = TokenBucket(rate=rate, capacity=capacity)
+        self._lock = None
+
+    def _take_local(self) -> bool:
+        """Takes a token taken from the database before, returns False if there is none"""
+        if self.tokens and asyncio.get_running_loop().time() - self.taken_at < 1:
+            self.tokens -= 1
+            return True
+
+        self.tokens = 0
+        return False
+
+    async def _reserve(self) -> float:
+        """Takes a batch of tokens from the database and returns 0, or returns seconds until a token is available"""
+        try:
+            async with DatabaseManager() as db:
+                taken, left = await db.take_rate_tokens(name=self.name, rate=self.rate, capacity=self.capacity,
+                                                        amount=self.batch, now=time.time())
+        except Exception as e:
+            logging.error(msg=f"An error occurred during taking tokens of rate limit {self.name}: {e}")
+            await self.fallback.acquire()
+            taken, left = 1, 0
+
+        if not taken:
+            return max((1 - left) / self.rate, 0.001)
+
+        self.tokens = taken
+        self.taken_at = asyncio.get_running_loop().time()
+        return 0.0
+
+    async def acquire(self):
+        """Waits until a token is available and takes it"""
+        # One sender at a time refills the local tokens, the others wait for them instead of hitting the database
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while not self._take_local():
+                if delay := await self._reserve():
+                    await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Telegram rate limits shared by every pipeline of the process.
+
+    Private chats have positive ids and groups negative ones, so a message to a group takes a token from its chat
+    bucket and from its per-minute group bucket. Buckets of idle chats are dropped once they would be full again.
+
+    Senders do not wait for a busy chat, they get the delay instead and move on to other messages, so a burst of
+    messages to one group does not block delivery to everyone else.
+
+    Args:
+        global_rate (float): Messages per second for the whole bot.
+        chat_rate (float): Messages per second for a single chat.
+        group_rate (float): Messages per minute for a single group.
+        max_chats (int): Maximum amount of chats whose buckets are kept.
+        shared_name (str, optional): Name of the database bucket of the bot-wide limit shared with other processes.
+            The bot-wide limit applies to this process alone if not given.
+        batch (int): Amount of tokens of the shared bucket taken from the database at once.
+    """
+    def __init__(self, global_rate: float, chat_rate: float, group_rate: float, max_chats: int = 100000,
+                 shared_name: str = None, batch: int = 1):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        if shared_name is None:
+            self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        else:
+            self.global_bucket = SharedTokenBucket(name=shared_name, rate=global_rate, capacity=global_rate,
+                                                   batch=batch)
+        self.chat_buckets = TTLCache(maxsize=max_chats, ttl=max(1 / chat_rate, 1))
+        self.group_buckets = TTLCache(maxsize=max_chats, ttl=60)
+
+    def _get_bucket(self, buckets: TTLCache, chat_id: int, rate: float, capacity: float) -> TokenBucket:
+        bucket = buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(rate=rate, capacity=capacity)
+        # Writing the bucket back keeps it alive while the chat is active
+        buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: int) -> float:
+        """Takes tokens for a message to the chat and returns 0, or returns seconds until the chat is free again
+        without taking any token"""
+        buckets = [self._get_bucket(self.chat_buckets, chat_id, rate=self.chat_rate, capacity=1)]
+        if chat_id < 0:
+            buckets.append(self._get_bucket(self.group_buckets, chat_id, rate=self.group_rate / 60,
+                                            capacity=self.group_rate))
+
+        delay = max(bucket.get_delay() for bucket in buckets)
+        if delay:
+            return delay
+
+        for bucket in buckets:
+            bucket.take()
+
+        await self.global_bucket.acquire()
+        return 0.0
+
+
+class DeliveryJob:
+    """
+    A single outgoing request.
+
+    Args:
+        action (callable): Function without arguments returning the awaitable which performs the request, e.g.
+            functools.partial(bot.send_message, chat_id=chat_id, text=text).
+        chat_id (int, optional): Telegram chat the message is sent to. Jobs without chat, e.g. GoHighLevel calls, are
+            not rate limited.
+        description (str, optional): Description used in logs, e.g. the user the message is sent to.
+        on_done (callable, optional): Coroutine function called with True once the job has been performed, or with
+            False once it has failed for good.
+    """
+    __slots__ = ("action", "chat_id", "description", "on_done", "attempts")
+
+    def __init__(self, action, chat_id: int = None, description: str = "", on_done=None):
+        self.action = action
+        self.chat_id = chat_id
+        self.description = description
+        self.on_done = on_done
+        self.attempts = 0
+
+
+class DeliveryReport:
+    """
+    Outcome and throughput of a pipeline run.
+
+    Attributes:
+        sent (int): Amount of jobs performed successfully.
+        failed (int): Amount of jobs which failed or ran out of retries.
+        retried (int): Amount of reschedules caused by flood limits.
+        elapsed (float): Seconds the run took.
+    """
+    __slots__ = ("sent", "failed", "retried", "elapsed")
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Jobs performed per second"""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f"DeliveryReport(sent={self.sent}, failed={self.failed}, retried={self.retried}, "
+                f"elapsed={self.elapsed:.1f}s, throughput={self.throughput:.1f}/s)")
+
+
+class DeliveryPipeline:
+    """
+    A pool of concurrent senders performing delivery jobs within Telegram rate limits.
+
+    Args:
+        limiter (RateLimiter): Rate limiter shared by the senders.
+        concurrency (int): Amount of concurrent senders.
+        max_retries (int): How many times a job rejected with a flood limit error is rescheduled.
+    """
+    def __init__(self, limiter: RateLimiter, concurrency: int, max_retries: int):
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._reschedules = set()
+
+    async def deliver(self, jobs) -> DeliveryReport:
+        """Performs all jobs and returns the report once every job has been sent or has failed"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        report = DeliveryReport()
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        workers = [asyncio.create_task(self._work(queue=queue, report=report))
+                   for _ in range(min(self.concurrency, queue.qsize()))]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        report.elapsed = loop.time() - started
+        return report
+
+    async def _work(self, queue: asyncio.Queue, report: DeliveryReport):
+        """Takes jobs from the queue until cancelled"""
+        while True:
+            job = await queue.get()
+            try:
+                retry_after = await self._perform(job=job, report=report)
+            except BaseException:
+                queue.task_done()
+                raise
+
+            if retry_after is None:
+                queue.task_done()
+            else:
+                task = asyncio.create_task(self._reschedule(queue=queue, job=job, delay=retry_after))
+                self._reschedules.add(task)
+                task.add_done_callback(self._reschedules.discard)
+
+    async def _perform(self, job: DeliveryJob, report: DeliveryReport):
+        """Performs the job. Returns seconds to wait before the job is retried, or None if it is finished"""
+        if job.chat_id is not None:
+            delay = await self.limiter.acquire(job.chat_id)
+            if delay:
+                return delay
+
+        job.attempts += 1
+        try:
+            await job.action()
+            report.sent += 1
+            ok = True
+
+        except (TelegramRetryAfter, FloodWaitError) as e:
+            retry_after = e.retry_after if isinstance(e, TelegramRetryAfter) else e.seconds
+            if job.attempts <= self.max_retries:
+                report.retried += 1
+                return retry_after
+
+            report.failed += 1
+            ok = False
+            logging.error(msg=f"An error occurred during delivery: {e}. {job.description} "
+                              f"(gave up after {job.attempts} attempts)")
+
+        except Exception as e:
+            report.failed += 1
+            ok = False
+            logging.error(msg=f"An error occurred during delivery: {e}. {job.description}")
+
+        if job.on_done is not None:
+            try:
+                await job.on_done(ok)
+            except Exception as e:
+                logging.error(msg=f"An error occurred during delivery result handling: {e}. {job.description}")
+
+        return None
+
+    @staticmethod
+    async def _reschedule(queue: asyncio.Queue, job: DeliveryJob, delay: float):
+        """Puts the job back to the queue after delay, the original queue entry is finished only then"""
+        try:
+            await asyncio.sleep(delay)
+            queue.put_nowait(job)
+        finally:
+            queue.task_done()
+
+
+class Digest:
+    """
+    Texts collected per chat and sent as one combined message per chat, instead of one message per text. A digest
+    longer than the Telegram message limit is split into several messages.
+
+    Args:
+        send (callable): Coroutine function sending a message, called with chat_id and text, e.g. bot.send_message.
+        separator (str, optional): Separator of the texts in a combined message.
+    """
+    def __init__(self, send, separator: str = "\n\n"):
+        self.send = send
+        self.separator = separator
+        self.chats = {}
+
+    def add(self, chat_id: int, text: str, on_done=None):
+        """Adds text for the chat. on_done is called with the delivery result of the message containing the text"""
+        self.chats.setdefault(chat_id, []).append((text, on_done))
+
+    def get_jobs(self, description: str = "Digest") -> list:
+        """Returns delivery jobs of the combined messages"""
+        jobs = []
+        for chat_id, items in self.chats.items():
+            for chunk in self._split(items):
+                texts = [text for text, _ in chunk]
+                callbacks = [on_done for _, on_done in chunk if on_done is not None]
+                jobs.append(DeliveryJob(action=partial(self.send, chat_id=chat_id, text=self.separator.join(texts)),
+                                        chat_id=chat_id,
+                                        description=f"{description} of {len(texts)} messages to chat {chat_id}",
+                                        on_done=partial(self._done, callbacks) if callbacks else None))
+
+        return jobs
+
+    def _split(self, items: list) -> list:
+        """Splits texts of a chat into chunks fitting into one message each"""
+        chunks = [[]]
+        length = 0
+        for item in items:
+            added_length = len(item[0]) + (len(self.separator) if chunks[-1] else 0)
+            if chunks[-1] and length + added_length > MESSAGE_LENGTH_LIMIT:
+                chunks.append([])
+                added_length = len(item[0])
+                length = 0
+
+            chunks[-1].append(item)
+            length += added_length
+
+        return chunks
+
+    @staticmethod
+    async def _done(callbacks: list, ok: bool):
+        await asyncio.gather(*(on_done(ok) for on_done in callbacks))
+
+
+async def fan_out(send, destinations: dict, description: str = "Fan-out", pipeline: DeliveryPipeline = None) -> dict:
+    """
+    Sends the same request to several chats concurrently within the rate limits, instead of one chat after another,
+    so the fan-out takes about as long as the slowest single request.
+
+    Args:
+        send (callable): Coroutine function performing the request, called with chat_id and the chat's keyword
+            arguments, e.g. bot.send_video.
+        destinations (dict): Keyword arguments of the request by chat ID.
+        description (str, optional): Description used in logs.
+        pipeline (DeliveryPipeline, optional): Pipeline performing the requests. Defaults to the process-wide one.
+
+    Returns:
+        dict: Whether the request succeeded by chat ID. A failed chat does not affect the others, so only the failed
+            ones have to be retried.
+    """
+    results = dict.fromkeys(destinations, False)
+
+    async def record(chat_id: int, ok: bool):
+        results[chat_id] = ok
+
+    jobs = [DeliveryJob(action=partial(send, chat_id=chat_id, **kwargs),
+                        chat_id=chat_id,
+                        description=f"{description} to chat {chat_id}",
+                        on_done=partial(record, chat_id))
+            for chat_id, kwargs in destinations.items()]
+    await (pipeline or delivery).deliver(jobs)
+
+    return results
+
+
+limiter = RateLimiter(global_rate=GLOBAL_MESSAGES_PER_SECOND,
+                      chat_rate=CHAT_MESSAGES_PER_SECOND,
+                      group_rate=GROUP_MESSAGES_PER_MINUTE,
+                      shared_name="telegram_bot",
+                      batch=GLOBAL_TOKEN_BATCH)
+
+delivery = DeliveryPipeline(limiter=limiter, concurrency=DELIVERY_CONCURRENCY, max_retries=DELIVERY_MAX_RETRIES)
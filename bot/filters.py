@@ -4,8 +4,8 @@
 from aiogram.filters import Filter
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
+from bot.middlewares import Identity
 from bot.states import AdminProgramState
-from database.main import DatabaseManager
 
 
 class IsAdminProgramState(Filter):
@@ -58,17 +58,16 @@ class IsSuperAdmin(Filter):
     This filter is applied to CallbackQueries to determine whether the user performing the action is a super admin.
     """
 
-    async def __call__(self, call: CallbackQuery) -> bool:
+    async def __call__(self, call: CallbackQuery, identity: Identity) -> bool:
         """
         Asynchronously checks if the user from the CallbackQuery is a super admin.
 
         Args:
             call (CallbackQuery): The callback query from a Telegram user.
+            identity (Identity | None): Identity of the user resolved by IdentityMiddleware, None if it could not be
+                resolved.
 
         Returns:
             bool: True if the user is a super admin, False otherwise.
         """
-        async with DatabaseManager("test.db") as db:
-            parameters = {"column": "telegram_id",
-                          "value": call.from_user.id}
-            return bool(await db.check_existence(table_name="super_admins", parameters=parameters))
+        return identity is not None and identity.is_super_admin
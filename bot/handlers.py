@@ -4,6 +4,7 @@
 import re
 import bot.texts as texts
 import logging
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from bot.main import dp, bot, client
@@ -12,13 +13,18 @@ from bot.states import UserState, AdminState, AdminProgramState, AdminNewGroup
 from bot.keyboards import (get_submit_training_kb, get_training_day_calendar, get_types_of_training_kb, get_back_kb,
                            get_types_of_practice_kb, get_settings_keyboard, get_admin_main_menu_kb, get_confirm_kb,
                            get_confirm_admin_kb, get_programs_kb, get_commands_kb)
+from database.cache import program_catalogue, role_catalogue
 from database.main import DatabaseManager
-from google_spreadsheets.functions import save_data_to_sheet
+from database.writer import writer
 from aiogram.filters import Command
 from bot.filters import IsAdminProgramState, NewChatMembersFilter, IsSuperAdmin
-from bot.settings import TELETHON_ID
+from bot.jobs import job_queue
+from bot.middlewares import Identity
+from bot.submissions import get_homework_jobs, get_video_jobs
+from bot.settings import ADMIN_ALERTS_MODE
 from bot.functions import create_main_group
-from go_high_level.api_calls import get_pipeline, delete_user, change_stage
+from bot.notifications import admin_alerts
+from go_high_level.api_calls import get_pipeline, delete_user
 
 
 logging.basicConfig(filename='logs.log', level=logging.INFO,
@@ -154,27 +160,26 @@ async def type_of_practice(call: CallbackQuery, state: FSMContext):
 
 
 @dp.message(UserState.homework)
-async def handle_homework(message: Message, state: FSMContext):
+async def handle_homework(message: Message, state: FSMContext, identity: Identity):
     """Receives user homework in text"""
     try:
-        async with DatabaseManager("test.db") as db:
-            user_data = await db.get_all_user_data(table_name="all_users", telegram_id=message.from_user.id)
+        if identity is None:
+            await message.answer(text=texts.error_occurred)
+            return
 
-        small_user_group = user_data["small_group_id"]
-        main_user_group = user_data["main_group_id"]
+        user_context = identity.user_context
 
         data = await state.get_data()
         user_name = data["user_name"]
         homework_date = data["date"]
 
-        await bot.forward_message(chat_id=small_user_group,
-                                  from_chat_id=message.from_user.id,
-                                  message_id=message.message_id)
+        data_to_sheets = [user_name, message.from_user.id, data["process"], homework_date, message.text]
 
-        if user_data["privacy"] == "Public":
-            await bot.forward_message(chat_id=main_user_group,
-                                      from_chat_id=message.from_user.id,
-                                      message_id=message.message_id)
+        # Forwards, the spreadsheet row and the submission record are sent once the user has got the reply
+        await job_queue.enqueue(get_homework_jobs(user_context=user_context,
+                                                  message_id=message.message_id,
+                                                  sheet_data=data_to_sheets,
+                                                  day=homework_date))
 
         if data["process"] == "homework":
             thanks_text = texts.thanks_for_submitting_homework
@@ -183,29 +188,11 @@ async def handle_homework(message: Message, state: FSMContext):
 
         await message.answer(text=thanks_text)
 
-        async with DatabaseManager("test.db") as db:
-            parameters = {"column": "telegram_id",
-                          "value": int(message.from_user.id)}
-            user_data = await db.check_existence(table_name="all_users", parameters=parameters)
-            query = f"""SELECT group_spreadsheet_id 
-                                    FROM groups 
-                                    WHERE group_id = {user_data['main_group_id']}"""
-            spreadsheet_data = await db.custom_query(query)
-            spreadsheet_id = spreadsheet_data[0]["group_spreadsheet_id"]
-
-        data_to_sheets = [user_name, message.from_user.id, data["process"], homework_date, message.text]
-
-        await save_data_to_sheet(data=data_to_sheets, spreadsheet=spreadsheet_id, homework=True)
-
         kb = await get_submit_training_kb()
         await bot.send_message(chat_id=message.from_user.id,
                                text=texts.greeting_for_user.format(user_name),
                                reply_markup=kb)
 
-        async with DatabaseManager("test.db") as db:
-            data = {"last_homework": homework_date}
-            await db.update_data(table_name="all_users", data=data, telegram_id=message.from_user.id)
-
         await state.clear()
         await state.set_state(UserState.greeted)
         await state.update_data(user_name=user_name)
@@ -331,18 +318,16 @@ async def handle_back_meditation(call: CallbackQuery, state: FSMContext):
 
 
 @dp.message(UserState.video)
-async def handle_video(message: Message, state: FSMContext):
+async def handle_video(message: Message, state: FSMContext, identity: Identity):
     """Receives video from user and saves it into gdrive"""
     try:
-        if message.video:
-            async with DatabaseManager("test.db") as db:
-                user_data = await db.get_all_user_data(table_name="all_users", telegram_id=message.from_user.id)
-
-                query = f"""SELECT * FROM programs WHERE id = {user_data['user_program']}"""
-                user_program = await db.custom_query(query=query)
+        if identity is None:
+            await message.answer(text=texts.error_occurred)
+            return
 
-            small_user_group = user_data["small_group_id"]
-            main_user_group = user_data["main_group_id"]
+        if message.video:
+            user_context = identity.user_context
+            user_data = user_context.user
 
             data = await state.get_data()
             user_last_name = user_data["last_name"]
@@ -364,12 +349,12 @@ async def handle_video(message: Message, state: FSMContext):
                                                              data["duration"],
                                                              data["meditation"])
 
-            video_file = message.video.file_id
-            await bot.send_video(chat_id=int(TELETHON_ID), video=video_file, caption=data_to_telethon)
-            await bot.send_video(chat_id=small_user_group, video=video_file, caption=caption_for_video)
-
-            if user_data["privacy"] == "Public":
-                await bot.send_video(chat_id=main_user_group, video=video_file, caption=caption_for_video)
+            # The videos, the GoHighLevel stage change and the submission record are sent once the user has got the reply
+            await job_queue.enqueue(get_video_jobs(user_context=user_context,
+                                                   video=message.video.file_id,
+                                                   telethon_caption=data_to_telethon,
+                                                   caption=caption_for_video,
+                                                   day=training_date))
 
             if data["process"] == "homework":
                 thanks_text = texts.thanks_for_submitting_homework
@@ -378,16 +363,6 @@ async def handle_video(message: Message, state: FSMContext):
 
             await message.answer(text=thanks_text)
 
-            if str(user_data['last_practice']).isdigit() and user_data['last_practice'] >= 3:
-                pipeline_id = user_program[0]["ghl_pipeline_id"]
-                next_stage_id = user_program[0]["ghl_students_id"]
-                opp_id = user_data["ghl_opp_id"]
-                await change_stage(opportunity_id=opp_id, stage_id=next_stage_id, pipeline_id=pipeline_id)
-
-            async with DatabaseManager("test.db") as db:
-                data = {"last_practice": training_date}
-                await db.update_data(table_name="all_users", data=data, telegram_id=message.from_user.id)
-
             kb = await get_submit_training_kb()
             await bot.send_message(chat_id=message.from_user.id,
                                    text=texts.greeting_for_user.format(user_name),
@@ -429,21 +404,19 @@ async def handle_back_video(call: CallbackQuery, state: FSMContext):
 
 
 @dp.message(Command("commands"))
-async def handle_settings_command(message: Message, state: FSMContext):
+async def handle_settings_command(message: Message, state: FSMContext, identity: Identity):
     """Handles settings command for users"""
     try:
-        async with DatabaseManager("test.db") as db:
-            parameters = {"column": "telegram_id",
-                          "value": message.from_user.id}
-            admin = await db.check_existence(table_name="admins", parameters=parameters)
-            authorized_user = await db.check_existence(table_name="all_users", parameters=parameters)
+        if identity is None:
+            await message.answer(text=texts.error_occurred)
+            return
 
-        if admin:
+        if identity.is_admin:
             text = texts.create_new_group
             kb = await get_commands_kb(admin=True)
             await state.set_state(AdminState.commands_state)
 
-        elif authorized_user:
+        elif identity.user is not None:
             text = texts.change_privacy
             kb = await get_commands_kb()
             await state.set_state(UserState.commands_state)
@@ -468,8 +441,7 @@ async def handle_settings_command(message: Message, state: FSMContext):
 async def handle_commands_admin(call: CallbackQuery, state: FSMContext):
     try:
         if call.data == "create_group":
-            async with DatabaseManager("test.db") as db:
-                all_programs = await db.get_all_table_data(table_name="programs")
+            all_programs = program_catalogue.get_all()
 
             if not all_programs:
                 await call.message.edit_text(text=texts.no_programs)
@@ -496,19 +468,20 @@ async def handle_commands_admin(call: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(UserState.commands_state)
-async def handle_command_user(call: CallbackQuery, state: FSMContext):
+async def handle_command_user(call: CallbackQuery, state: FSMContext, identity: Identity):
     try:
-        if call.data == "privacy":
-            async with DatabaseManager("test.db") as db:
-                user_data = await db.get_all_user_data(table_name="all_users", telegram_id=call.from_user.id)
+        if identity is None:
+            await call.answer(text=texts.error_occurred, show_alert=True)
+            return
 
-                current_privacy = user_data["privacy"]
+        if call.data == "privacy":
+            current_privacy = identity.user["privacy"]
 
-                kb = await get_settings_keyboard(call.from_user.id)
-                await call.message.edit_text(text=texts.settings_text.format(current_privacy),
-                                             reply_markup=kb)
+            kb = await get_settings_keyboard(current_privacy)
+            await call.message.edit_text(text=texts.settings_text.format(current_privacy),
+                                         reply_markup=kb)
 
-                await state.set_state(UserState.privacy_state)
+            await state.set_state(UserState.privacy_state)
 
         else:
             await call.message.delete()
@@ -538,10 +511,7 @@ async def handle_program_choice(call: CallbackQuery, state: FSMContext):
 
         else:
             program_id = int(call.data)
-            async with DatabaseManager("test.db") as db:
-                parameters = {"column": "id",
-                              "value": program_id}
-                program_data = await db.check_existence(table_name="programs", parameters=parameters)
+            program_data = program_catalogue.get(program_id)
 
             await state.update_data(program=program_id,
                                     program_title=program_data["program_name"])
@@ -614,7 +584,7 @@ async def handle_new_group_title(message: Message, state: FSMContext):
 
     del data["program_title"]
 
-    async with DatabaseManager("test.db") as db:
+    async with DatabaseManager() as db:
         await db.insert_data(table_name="groups", data=data)
 
     text = texts.group_created.format(program_title) + texts.admin_menu.format(message.from_user.first_name)
@@ -648,13 +618,14 @@ async def handle_back_title(call: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(UserState.privacy_state)
-async def handle_privacy_settings(call: CallbackQuery, state: FSMContext):
+async def handle_privacy_settings(call: CallbackQuery, state: FSMContext, identity: Identity):
     """Handles actions in settings menu for authorized user"""
     try:
-        async with DatabaseManager("test.db") as db:
-            user_data = await db.get_all_user_data(table_name="all_users", telegram_id=call.from_user.id)
+        if identity is None:
+            await call.answer(text=texts.error_occurred, show_alert=True)
+            return
 
-        user_name = user_data["first_name"]
+        user_name = identity.user["first_name"]
 
         if call.data == "previous_menu":
             kb = await get_submit_training_kb()
@@ -664,18 +635,16 @@ async def handle_privacy_settings(call: CallbackQuery, state: FSMContext):
                                          reply_markup=kb)
 
         elif call.data == "public" or call.data == "private":
-            async with DatabaseManager("test.db") as db:
-                if call.data == "public":
-                    data = {"privacy": "Public"}
-                else:
-                    data = {"privacy": "Private"}
+            if call.data == "public":
+                data = {"privacy": "Public"}
+            else:
+                data = {"privacy": "Private"}
 
-                await db.update_data(table_name="all_users", data=data, telegram_id=call.from_user.id)
-                user_data = await db.get_all_user_data(table_name="all_users", telegram_id=call.from_user.id)
+            await writer.update_data(table_name="all_users", data=data, telegram_id=call.from_user.id)
 
-            current_privacy = user_data["privacy"]
+            current_privacy = data["privacy"]
 
-            kb = await get_settings_keyboard(call.from_user.id)
+            kb = await get_settings_keyboard(current_privacy)
             await call.message.edit_text(text=texts.settings_text.format(current_privacy),
                                          reply_markup=kb)
 
@@ -740,10 +709,10 @@ async def handle_program_end_time(message: Message, state: FSMContext):
     if re.match(end_date_pattern, message.text):
         await state.update_data(program_end_date=message.text)
         kb = await get_back_kb()
-        await message.answer(text=texts.provide_spreadsheet_id,
+        await message.answer(text=texts.program_timezone,
                              reply_markup=kb)
 
-        await state.set_state(AdminProgramState.new_program_spreadsheet)
+        await state.set_state(AdminProgramState.new_program_timezone)
 
     else:
         kb = await get_back_kb()
@@ -751,6 +720,28 @@ async def handle_program_end_time(message: Message, state: FSMContext):
                              reply_markup=kb)
 
 
+@dp.message(AdminProgramState.new_program_timezone)
+async def handle_program_timezone(message: Message, state: FSMContext):
+    """Handles new program time zone, "-" keeps the server time zone"""
+    timezone = message.text.strip()
+    try:
+        if timezone != "-":
+            ZoneInfo(timezone)
+
+    except (ZoneInfoNotFoundError, ValueError):
+        kb = await get_back_kb()
+        await message.answer(text=texts.incorrect_timezone,
+                             reply_markup=kb)
+
+    else:
+        await state.update_data(program_timezone=timezone if timezone != "-" else None)
+        kb = await get_back_kb()
+        await message.answer(text=texts.provide_spreadsheet_id,
+                             reply_markup=kb)
+
+        await state.set_state(AdminProgramState.new_program_spreadsheet)
+
+
 @dp.message(AdminProgramState.new_program_spreadsheet)
 async def handle_program_spreadsheet(message: Message, state: FSMContext):
     """Handles new program spreadsheet"""
@@ -800,13 +791,20 @@ async def handle_admin_program_back(call: CallbackQuery, state: FSMContext):
 
             await state.set_state(AdminProgramState.new_program_title)
 
-        elif current_state == AdminProgramState.new_program_spreadsheet:
+        elif current_state == AdminProgramState.new_program_timezone:
             kb = await get_back_kb()
             await call.message.edit_text(text=texts.program_end_date,
                                          reply_markup=kb)
 
             await state.set_state(AdminProgramState.new_program_end_time)
 
+        elif current_state == AdminProgramState.new_program_spreadsheet:
+            kb = await get_back_kb()
+            await call.message.edit_text(text=texts.program_timezone,
+                                         reply_markup=kb)
+
+            await state.set_state(AdminProgramState.new_program_timezone)
+
         elif current_state == AdminProgramState.new_program_group_title:
             kb = await get_back_kb()
             await call.message.edit_text(text=texts.provide_spreadsheet_id,
@@ -826,12 +824,13 @@ async def handle_admin_program_back(call: CallbackQuery, state: FSMContext):
                 students_stage = pipeline["stages"]["Students"]
                 no_pops_stage = pipeline["stages"]["No POP's submitted"]
 
-                async with DatabaseManager("test.db") as db:
+                async with DatabaseManager() as db:
                     program_data_to_db = {"program_name": program_data["program_title"],
                                           "program_end": program_data["program_end_date"],
                                           "ghl_pipeline_id": pipeline_id,
                                           "ghl_students_id": students_stage,
-                                          "ghl_no_pop_id": no_pops_stage}
+                                          "ghl_no_pop_id": no_pops_stage,
+                                          "timezone": program_data.get("program_timezone")}
 
                     program_id = await db.insert_data(table_name="programs", data=program_data_to_db)
 
@@ -891,7 +890,7 @@ async def handle_back_from_deleting(call: CallbackQuery, state: FSMContext):
 async def handle_user_deleting(message: Message, state: FSMContext):
     """Handles deleting user with his Telegram id"""
     if message.text.isdigit():
-        async with DatabaseManager("test.db") as db:
+        async with DatabaseManager() as db:
             user_data = await db.get_all_user_data(table_name="all_users", telegram_id=int(message.text))
 
         if user_data:
@@ -920,7 +919,7 @@ async def handle_confirm_user_deleting(call: CallbackQuery, state: FSMContext):
     try:
         if call.data == "yes":
             state_data = await state.get_data()
-            async with DatabaseManager("test.db") as db:
+            async with DatabaseManager() as db:
                 parameters = {"column": "telegram_id",
                               "value": state_data["user_to_delete_id"]}
 
@@ -971,12 +970,8 @@ async def handle_program_deletion(call: CallbackQuery, state: FSMContext):
 
         else:
             program_id = int(call.data)
-            async with DatabaseManager("test.db") as db:
-                program_parameters = {"column": "id",
-                                      "value": program_id}
-
-                program_data = await db.check_existence(table_name="programs", parameters=program_parameters)
-                program_name = program_data["program_name"]
+            program_name = program_catalogue.get(program_id)["program_name"]
+            async with DatabaseManager() as db:
                 query = f"""SELECT * FROM all_users 
                                                      WHERE user_program = {program_id}"""
 
@@ -1011,22 +1006,15 @@ async def handle_new_members(message: Message):
     members_count = await bot.get_chat_member_count(chat_id=message.chat.id)
     chat_id = message.chat.id
 
-    async with DatabaseManager("test.db") as db:
-        all_admins = await db.get_all_table_data(table_name="admins")
+    async with DatabaseManager() as db:
         group_parameters = {"column": "group_id",
                             "value": chat_id}
         group_data = await db.check_existence(table_name="groups",
                                               parameters=group_parameters)
 
         if group_data:
-            program_id = group_data["program"]
-
-            program_parameters = {"column": "id",
-                                  "value": program_id}
-
-            program_data = await db.check_existence(table_name="programs",
-                                                    parameters=program_parameters)
-            admins_id = [admin["telegram_id"] for admin in all_admins]
+            program_data = program_catalogue.get(group_data["program"])
+            admins_id = role_catalogue.admin_ids
 
             if members_count >= 37:
                 if 37 < members_count < 40:
@@ -1035,8 +1023,11 @@ async def handle_new_members(message: Message):
                 else:
                     text = texts.group_is_almost_full.format(program_data["program_name"], members_count)
 
-                for admin_id in admins_id:
-                    await bot.send_message(text=text, chat_id=admin_id)
+                if ADMIN_ALERTS_MODE == "summary":
+                    admin_alerts.add(group_id=chat_id, text=text)
+                else:
+                    for admin_id in admins_id:
+                        await bot.send_message(text=text, chat_id=admin_id)
 
 
 @dp.callback_query(IsSuperAdmin())
@@ -1045,7 +1036,7 @@ async def handle_admin_adding(call: CallbackQuery):
     potential_admin_id = int(call.data.split("_")[1])
 
     if "yes" in call.data:
-        async with DatabaseManager("test.db") as db:
+        async with DatabaseManager() as db:
             potential_admin_data = await db.get_all_user_data(table_name="pending_admins",
                                                               telegram_id=potential_admin_id)
             await db.insert_data(table_name="admins", data=potential_admin_data)
@@ -1055,7 +1046,7 @@ async def handle_admin_adding(call: CallbackQuery):
         await bot.send_message(text=texts.message_for_added_admin, chat_id=potential_admin_id)
 
     else:
-        async with DatabaseManager("test.db") as db:
+        async with DatabaseManager() as db:
             potential_admin_data = await db.get_all_user_data(table_name="pending_admins",
                                                               telegram_id=potential_admin_id)
             await db.delete_user_from_db(table_name="pending_admins", telegram_id=potential_admin_id)
@@ -1074,13 +1065,11 @@ async def handle_non_authorized_callback(call: CallbackQuery):
                                 "last_name": call.from_user.last_name,
                                 "telegram_id": call.from_user.id}
 
-        async with DatabaseManager("test.db") as db:
-            await db.insert_data(table_name="pending_admins", data=potential_admin_data)
-            super_admins = await db.get_all_table_data(table_name="super_admins")
+        await writer.insert_data(table_name="pending_admins", data=potential_admin_data)
 
         kb = await get_confirm_admin_kb(telegram_id=call.from_user.id)
-        for admin in super_admins:
-            await bot.send_message(chat_id=admin["telegram_id"],
+        for super_admin_id in role_catalogue.super_admin_ids:
+            await bot.send_message(chat_id=super_admin_id,
                                    text=texts.confirm_admin.format(call.from_user.first_name, call.from_user.id),
                                    reply_markup=kb)
 
@@ -1089,25 +1078,23 @@ async def handle_non_authorized_callback(call: CallbackQuery):
 
 
 @dp.message()
-async def greeting_handler(message: Message, state: FSMContext):
+async def greeting_handler(message: Message, state: FSMContext, identity: Identity):
     """Handles first time message from user in private chat and updates user record
     in all_users with small group id if it is not updated"""
-    user_id = message.from_user.id
-
     if message.chat.type == "private":
-        async with DatabaseManager("test.db") as db:
-            parameters = {"column": "telegram_id",
-                          "value": user_id}
-            admin = await db.check_existence(table_name="admins", parameters=parameters)
-            verified_user = await db.check_existence(table_name="all_users", parameters=parameters)
+        if identity is None:
+            await message.answer(text=texts.error_occurred)
+            return
 
-        if admin:
+        verified_user = identity.user
+
+        if identity.is_admin:
             kb = await get_admin_main_menu_kb()
             await message.answer(text=texts.admin_menu.format(message.from_user.first_name),
                                  reply_markup=kb)
             await state.set_state(AdminState.main_menu)
 
-        elif verified_user:
+        elif verified_user is not None:
             kb = await get_submit_training_kb()
             user_name = verified_user["first_name"]
             await state.set_state(UserState.greeted)
@@ -1120,10 +1107,7 @@ async def greeting_handler(message: Message, state: FSMContext):
 
 
 async def exe_bot():
-    """Function to start a bot"""
-    async with DatabaseManager("test.db") as db:
-        await db.create_tables()
-
+    """Function to start a bot. The database has been migrated by start_program"""
     logging.info(msg="BOT started")
     await client.start()
     await bot.delete_webhook(drop_pending_updates=True)
@@ -0,0 +1,237 @@
+"""
+This module contains the durable background job queue.
+
+Handlers hand side effects which the user does not have to wait for, e.g. forwarding a submission to groups or saving
+it to a spreadsheet, to the queue and reply right away. Jobs are stored in the jobs table before the handler replies,
+and run afterwards by a bounded pool of workers. A failing job is retried with exponential backoff and marked as failed
+once it runs out of attempts. A job rejected with a flood limit error is retried after the time requested by Telegram,
+and the run is not counted towards its attempts, as the job itself has not failed.
+
+A job is reserved for its run by a lease, which is renewed while the job runs, so a long job, e.g. one waiting for
+flood limits, is not claimed a second time. Jobs interrupted by a shutdown are returned to the queue, and jobs of a
+crashed process are run again once their lease expires, so every job runs at least once and job functions have to
+tolerate being run again. A job which has done only a part of its work, e.g. delivered a message to some of its chats,
+raises PartialFailure with the payload of the rest, and only the rest is retried.
+
+Classes:
+    - PartialFailure: Raised by a job function which has done only a part of the job.
+    - JobQueue: A durable queue of background jobs served by a worker pool.
+
+Attributes:
+    job_queue (JobQueue): The process-wide job queue.
+
+Example:
+    @job_queue.job("forward_message")
+    async def forward_message(chat_id: int, from_chat_id: int, message_id: int):
+        await bot.forward_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+
+    await job_queue.enqueue([("forward_message", {"chat_id": chat_id, "from_chat_id": user_id, "message_id": 1})])
+"""
+
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramRetryAfter
+from telethon.errors import FloodWaitError
+
+from bot.settings import JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF, JOB_LEASE, JOB_POLL_INTERVAL
+from database.writer import writer
+
+
+class PartialFailure(Exception):
+    """
+    Raised by a job function which has done only a part of the job. The job is retried with the payload of the rest.
+
+    Args:
+        message (str): Description of the failure.
+        payload (dict): Payload of the part which is left to do.
+    """
+    def __init__(self, message: str, payload: dict):
+        super().__init__(message)
+        self.payload = payload
+
+
+def _format_time(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).isoformat(timespec="milliseconds")
+
+
+class JobQueue:
+    """
+    A durable queue of background jobs served by a worker pool.
+
+    Args:
+        workers (int): Amount of jobs run concurrently.
+        max_attempts (int): How many times a failing job is run.
+        backoff (timedelta): Delay before the first retry, doubled with every further attempt.
+        lease (timedelta): How long a started job is reserved for its run.
+        poll_interval (timedelta): How often due retries are checked for.
+    """
+    def __init__(self, workers: int, max_attempts: int, backoff: timedelta, lease: timedelta,
+                 poll_interval: timedelta):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.functions = {}
+        self._running = {}
+        self._wakeup = None
+        self._task = None
+        self._heartbeat = None
+
+    def job(self, kind: str):
+        """Decorator registering a coroutine function as the function of jobs of the kind. The function is called with
+        the job payload as keyword arguments"""
+        def register(func):
+            self.functions[kind] = func
+            return func
+
+        return register
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def enqueue(self, jobs: list) -> list:
+        """
+        Stores jobs in one transaction and returns their IDs once they are committed.
+
+        Args:
+            jobs (list): Tuples of job kind and payload dict. The payload has to be JSON serializable.
+
+        Returns:
+            list: IDs of the stored jobs.
+        """
+        job_ids = await writer.submit("enqueue_jobs",
+                                      jobs=[(kind, json.dumps(payload)) for kind, payload in jobs],
+                                      run_at=_format_time(datetime.now(timezone.utc)))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return job_ids
+
+    def start(self):
+        """Starts running jobs in the running event loop"""
+        if self.is_running:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._heartbeat = asyncio.create_task(self._renew())
+
+    async def stop(self):
+        """Stops running jobs. Jobs interrupted by the stop are returned to the queue"""
+        if not self.is_running:
+            return
+
+        self._task.cancel()
+        self._heartbeat.cancel()
+        running = list(self._running.items())
+        for _, task in running:
+            task.cancel()
+        await asyncio.gather(self._task, self._heartbeat, *(task for _, task in running), return_exceptions=True)
+        self._task = None
+        self._heartbeat = None
+
+        if running:
+            try:
+                await writer.submit("release_jobs", job_ids=[job_id for job_id, _ in running],
+                                    run_at=_format_time(datetime.now(timezone.utc)))
+            except Exception as e:
+                logging.error(msg=f"An error occurred during release of {len(running)} interrupted jobs: {e}")
+
+    async def _run(self):
+        """Claims due jobs whenever a worker is free until cancelled"""
+        while True:
+            self._wakeup.clear()
+            free = self.workers - len(self._running)
+            claimed = []
+            if free > 0:
+                now = datetime.now(timezone.utc)
+                try:
+                    claimed = await writer.submit("claim_jobs", now=_format_time(now),
+                                                  lease_until=_format_time(now + self.lease), limit=free,
+                                                  running=list(self._running))
+                except Exception as e:
+                    logging.error(msg=f"An error occurred during claiming of jobs: {e}")
+
+                for job in claimed:
+                    task = asyncio.create_task(self._execute(job))
+                    self._running[job["id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["id"]: self._finished(job_id))
+
+            # All workers were filled, more jobs may be due already
+            if claimed and len(claimed) == free:
+                await self._wakeup.wait()
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval.total_seconds())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew(self):
+        """Renews leases of the running jobs until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            if not self._running:
+                continue
+
+            try:
+                await writer.submit("renew_jobs", job_ids=list(self._running),
+                                    lease_until=_format_time(datetime.now(timezone.utc) + self.lease))
+            except Exception as e:
+                logging.error(msg=f"An error occurred during renewal of {len(self._running)} job leases: {e}")
+
+    def _finished(self, job_id: int):
+        self._running.pop(job_id, None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _execute(self, job):
+        """Runs the job and records its outcome"""
+        description = f"Job {job['id']} ({job['kind']}, attempt {job['attempts']})"
+        func = self.functions.get(job["kind"])
+        try:
+            if func is None:
+                raise LookupError(f"Unknown job kind {job['kind']}")
+
+            await func(**json.loads(job["payload"]))
+
+        except (TelegramRetryAfter, FloodWaitError) as e:
+            retry_after = e.retry_after if isinstance(e, TelegramRetryAfter) else e.seconds
+            await self._retry(job=job, error=e, delay=timedelta(seconds=retry_after), description=description,
+                              count_attempt=False)
+
+        except Exception as e:
+            payload = json.dumps(e.payload) if isinstance(e, PartialFailure) else None
+            if func is None or job["attempts"] >= self.max_attempts:
+                logging.error(msg=f"An error occurred during background job: {e}. {description} failed for good")
+                await self._record("fail_job", job_id=job["id"], error=str(e), payload=payload)
+            else:
+                await self._retry(job=job, error=e, delay=self.backoff * 2 ** (job["attempts"] - 1),
+                                  description=description, payload=payload)
+
+        else:
+            await self._record("finish_job", job_id=job["id"])
+
+    async def _retry(self, job, error: Exception, delay: timedelta, description: str, payload: str = None,
+                     count_attempt: bool = True):
+        logging.warning(msg=f"An error occurred during background job: {error}. {description} is retried in {delay}")
+        await self._record("retry_job", job_id=job["id"], run_at=_format_time(datetime.now(timezone.utc) + delay),
+                           error=str(error), payload=payload, count_attempt=count_attempt)
+
+    @staticmethod
+    async def _record(method: str, **kwargs):
+        """Records the outcome of a job run. If it cannot be recorded, the job is run again after its lease"""
+        try:
+            await writer.submit(method, **kwargs)
+        except Exception as e:
+            logging.error(msg=f"An error occurred during recording of background job {kwargs['job_id']}: {e}")
+
+
+job_queue = JobQueue(workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS, backoff=JOB_RETRY_BACKOFF, lease=JOB_LEASE,
+                     poll_interval=JOB_POLL_INTERVAL)
@@ -1,9 +1,68 @@
+"""
+This module contains the inline keyboards of the training bot.
+
+Keyboards which depend on their arguments only are built once per arguments and reused, see static_keyboard, and
+calendars are served from an LRU cache, so handlers do not rebuild identical markups on every update. Cached
+keyboards are shared and must not be modified.
+"""
+
+
 from aiogram.utils.keyboard import InlineKeyboardMarkup, InlineKeyboardButton
-from datetime import datetime
+from datetime import date
+from functools import lru_cache, wraps
 import calendar
-from database.main import DatabaseManager
+from database.cache import program_catalogue
+
+
+CALENDAR = calendar.Calendar()
+
+MONTHS_TITLES = {1: "January",
+                 2: "February",
+                 3: "March",
+                 4: "April",
+                 5: "May",
+                 6: "June",
+                 7: "July",
+                 8: "August",
+                 9: "September",
+                 10: "October",
+                 11: "November",
+                 12: "December"}
+
+DAYS_TITLES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+TODAY_MARK = "\u2714\ufe0f"
+NEXT_ARROW = "\u27A1\ufe0f"
+BACK_ARROW = "\u2B05\ufe0f"
+
+
+def static_keyboard(build):
+    """
+    Decorator of keyboard functions whose keyboards depend on their arguments only. The keyboard is built on the first
+    call with the arguments and the same object is returned by later calls.
+
+    Args:
+        build (callable): Coroutine function building the keyboard.
+
+    Returns:
+        callable: Coroutine function returning the cached keyboard.
+    """
+    keyboards = {}
+
+    @wraps(build)
+    async def get_keyboard(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        kb = keyboards.get(key)
+        if kb is None:
+            kb = keyboards[key] = await build(*args, **kwargs)
+
+        return kb
 
+    get_keyboard.cache_clear = keyboards.clear
+    return get_keyboard
 
+
+@static_keyboard
 async def get_submit_training_kb():
     """
     Generates an inline keyboard with a button for submitting new training.
@@ -19,6 +78,7 @@ async def get_submit_training_kb():
     return kb
 
 
+@static_keyboard
 async def get_types_of_training_kb():
     """
     Generates an inline keyboard with buttons for selecting types of training such as 'Homework' or 'Proof of practice'.
@@ -48,6 +108,9 @@ async def get_training_day_calendar(month_number=None, year_number=None):
     """
     Generates an inline keyboard that acts as a calendar for selecting a training day.
 
+    Calendars are built once per month and served from an LRU cache. The current day is part of the cache key of the
+    current month, so its today mark moves to the next day at midnight.
+
     Args:
         month_number (int, optional): The month number for the calendar. Defaults to the current month.
         year_number (int, optional): The year number for the calendar. Defaults to the current year.
@@ -55,8 +118,8 @@ async def get_training_day_calendar(month_number=None, year_number=None):
     Returns:
         InlineKeyboardMarkup: Inline keyboard markup representing a calendar for Telegram bot.
     """
-    current_date = datetime.now()
-    year = current_date.year
+    today = date.today()
+    year = today.year
 
     if year_number and year_number != year:
         year = year_number
@@ -71,99 +134,39 @@ async def get_training_day_calendar(month_number=None, year_number=None):
     if month_number:
         current_month = month_number
     else:
-        current_month = current_date.month
-
-    months_titles = {1: "January",
-                     2: "February",
-                     3: "March",
-                     4: "April",
-                     5: "May",
-                     6: "June",
-                     7: "July",
-                     8: "August",
-                     9: "September",
-                     10: "October",
-                     11: "November",
-                     12: "December"}
-
-    month_title = months_titles[current_month]
-
-    cal = calendar.Calendar()
-    initial_month = cal.monthdatescalendar(year, current_month)
-
-    formatted_month = {month_title: []}
-
-    for week in initial_month:
-        formatted_week = []
-        for day in week:
-            if day.month == current_month:
-                formatted_week.append([day, int(day.strftime("%d"))])
-            else:
-                formatted_week.append([day, " "])
-        formatted_month[month_title].append(formatted_week)
+        current_month = today.month
 
-    buttons = []
+    if (today.year, today.month) != (year, current_month):
+        today = None
 
-    month = [InlineKeyboardButton(text=f"{month_title}, {year}",
-                                  callback_data="None")]
-
-    days_row = [InlineKeyboardButton(text="Mon",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Tue",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Wed",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Thu",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Fri",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Sat",
-                                     callback_data="None"),
-                InlineKeyboardButton(text="Sun",
-                                     callback_data="None")
-                ]
-
-    today_mark = "\u2714\ufe0f"
-    next_arrow = "\u27A1\ufe0f"
-    back_arrow = "\u2B05\ufe0f"
-
-    dates_rows = []
-
-    for week in formatted_month[month_title]:
-        dates_row = []
-        for date in week:
-            if str(current_month) in str(date[0]):
-                if date[0] == current_date.date():
-                    dates_row.append(InlineKeyboardButton(text=today_mark,
-                                                          callback_data=str(date[0])))
-                else:
-                    dates_row.append(InlineKeyboardButton(text=str(date[1]),
-                                                          callback_data=str(date[0])))
-            else:
-                dates_row.append(InlineKeyboardButton(text=str(date[1]),
-                                                      callback_data='None'))
-        dates_rows.append(dates_row)
+    return _build_calendar(year=year, month=current_month, today=today)
 
-    next_back_row = [InlineKeyboardButton(text=back_arrow,
-                                          callback_data=f"back_{current_month}_{year}"),
-                     InlineKeyboardButton(text=next_arrow,
-                                          callback_data=f"next_{current_month}_{year}")]
 
-    back_button = [InlineKeyboardButton(text="Back",
-                                        callback_data="previous_menu")]
+@lru_cache(maxsize=64)
+def _build_calendar(year: int, month: int, today: date = None) -> InlineKeyboardMarkup:
+    """Builds the calendar of the month, with the today mark on today if it is a day of the month"""
+    buttons = [[InlineKeyboardButton(text=f"{MONTHS_TITLES[month]}, {year}", callback_data="None")],
+               [InlineKeyboardButton(text=day_title, callback_data="None") for day_title in DAYS_TITLES]]
 
-    buttons.append(month)
-    buttons.append(days_row)
-    for date_row in dates_rows:
-        buttons.append(date_row)
-    buttons.append(next_back_row)
-    buttons.append(back_button)
+    for week in CALENDAR.monthdatescalendar(year, month):
+        dates_row = []
+        for day in week:
+            if day.month != month:
+                dates_row.append(InlineKeyboardButton(text=" ", callback_data="None"))
+            elif day == today:
+                dates_row.append(InlineKeyboardButton(text=TODAY_MARK, callback_data=str(day)))
+            else:
+                dates_row.append(InlineKeyboardButton(text=str(day.day), callback_data=str(day)))
+        buttons.append(dates_row)
 
-    kb = InlineKeyboardMarkup(inline_keyboard=buttons)
+    buttons.append([InlineKeyboardButton(text=BACK_ARROW, callback_data=f"back_{month}_{year}"),
+                    InlineKeyboardButton(text=NEXT_ARROW, callback_data=f"next_{month}_{year}")])
+    buttons.append([InlineKeyboardButton(text="Back", callback_data="previous_menu")])
 
-    return kb
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@static_keyboard
 async def get_types_of_practice_kb():
     """
     Generates an inline keyboard with buttons for selecting the type of practice, such as 'Morning training'
@@ -190,6 +193,7 @@ async def get_types_of_practice_kb():
     return kb
 
 
+@static_keyboard
 async def get_back_kb():
     """
     Generates an inline keyboard with a 'Back' button for navigation.
@@ -205,24 +209,20 @@ async def get_back_kb():
     return kb
 
 
-async def get_settings_keyboard(user_id: int):
+@static_keyboard
+async def get_settings_keyboard(current_privacy: str):
     """
     Generates an inline keyboard for user settings, allowing a user to toggle between 'Public'
     and 'Private' privacy settings.
 
     Args:
-        user_id (int): The user ID for whom the settings are being adjusted.
+        current_privacy (str): The current privacy setting of the user, 'Public' or 'Private'.
 
     Returns:
         InlineKeyboardMarkup: Inline keyboard markup for Telegram bot.
     """
     buttons = []
 
-    async with DatabaseManager("test.db") as db:
-        user_data = await db.get_all_user_data(table_name="all_users", telegram_id=user_id)
-
-    current_privacy = user_data["privacy"]
-
     check_mark = "\u2714"
 
     if current_privacy == "Public":
@@ -247,6 +247,7 @@ async def get_settings_keyboard(user_id: int):
     return kb
 
 
+@static_keyboard
 async def get_admin_main_menu_kb():
     """
     Generates an inline keyboard for the admin main menu, with options like 'Create a new program' or 'Delete user'.
@@ -272,6 +273,7 @@ async def get_admin_main_menu_kb():
     return kb
 
 
+@static_keyboard
 async def get_confirm_kb():
     """
     Generates an inline keyboard with 'Yes' and 'No' buttons for general confirmation purposes.
@@ -326,10 +328,7 @@ async def get_programs_kb():
     """
     buttons = []
 
-    async with DatabaseManager("test.db") as db:
-        all_programs = await db.get_all_table_data(table_name="programs")
-
-    for program in all_programs:
+    for program in program_catalogue.get_all():
         buttons.append([InlineKeyboardButton(text=program["program_name"],
                                              callback_data=str(program["id"]))])
 
@@ -343,6 +342,7 @@ async def get_programs_kb():
     return kb
 
 
+@static_keyboard
 async def get_commands_kb(admin: bool = False, non_authorized: bool = False):
     """
     Generates an inline keyboard with different command options based on the user's role (admin or non-authorized).
@@ -6,7 +6,8 @@ Telegram bot interactions and user communications.
 
 The Aiogram library is utilized for its asynchronous framework which suits
 the real-time nature of a Telegram bot. It facilitates the creation of a bot instance,
-a dispatcher for routing incoming messages, and a memory storage for state management.
+a dispatcher for routing incoming messages, and a storage for state management which keeps
+conversation states in the database, so they survive restarts.
 
 Telethon, a Python client for Telegram's API, is used alongside Aiogram to provide
 additional functionalities and access to Telegram's features that are not available
@@ -15,8 +16,11 @@ in the Bot API. This allows for a more comprehensive integration with the Telegr
 The configuration for the bot and client, such as the API token, app ID, and app hash,
 is sourced from the bot.settings module.
 
+The identity of the user an update comes from is resolved once per update by IdentityMiddleware
+and passed to filters and handlers as the identity argument.
+
 Attributes:
-    storage (MemoryStorage): An Aiogram storage system to keep track of the bot's state.
+    storage (SQLiteStorage): An Aiogram storage system to keep track of the bot's state.
     bot (Bot): The Aiogram Bot instance initialized with the token and parse mode.
     dp (Dispatcher): The Aiogram Dispatcher instance for routing and handling updates.
     client (TelegramClient): The Telethon client instance for advanced Telegram API operations.
@@ -26,11 +30,13 @@ Attributes:
 from aiogram import Bot, Dispatcher
 from bot.settings import TOKEN, API_ID, API_HASH
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from bot.middlewares import IdentityMiddleware
+from database.fsm_storage import SQLiteStorage
 from telethon import TelegramClient
 
 
-storage = MemoryStorage()
+storage = SQLiteStorage()
 bot = Bot(token=TOKEN, parse_mode=ParseMode.HTML)
 dp = Dispatcher(storage=storage)
+dp.update.outer_middleware(IdentityMiddleware())
 client = TelegramClient('', API_ID, API_HASH)  # You need to specify session name
@@ -0,0 +1,112 @@
+"""
+This module contains the middlewares of the training bot dispatcher.
+
+IdentityMiddleware resolves who an update comes from once per update, before filters and handlers run, and passes the
+result to them as the identity keyword argument. Roles are taken from the in-process role catalogue, which is
+reloaded once it is older than ROLE_CATALOGUE_TTL seconds, the user's program from the program catalogue, and the
+user's profile and main group from the user and group caches, so most updates are resolved without a query. The
+profile is only resolved for updates from private chats, where handlers need it.
+
+Classes:
+    - Identity: Roles and profile of the user an update comes from.
+    - IdentityMiddleware: Outer update middleware injecting the identity.
+
+Functions:
+    - get_identity(telegram_id, with_profile): Resolves the identity of a user.
+
+Example:
+    @dp.message(Command("commands"))
+    async def handle_settings_command(message: Message, state: FSMContext, identity: Identity):
+        if identity.is_admin:
+            ...
+"""
+
+
+import logging
+
+from aiogram import BaseMiddleware
+
+from database.cache import role_catalogue
+from database.main import DatabaseManager
+from database.records import UserContext
+
+
+class Identity:
+    """
+    Roles and profile of the user an update comes from.
+
+    Args:
+        telegram_id (int): ID of the user.
+        is_admin (bool): Whether the user is in the admins table.
+        is_super_admin (bool): Whether the user is in the super_admins table.
+        user_context (UserContext | None): The user's all_users row, program and main group. None if the user is not
+            registered or the update does not come from a private chat.
+    """
+    __slots__ = ("telegram_id", "is_admin", "is_super_admin", "user_context")
+
+    def __init__(self, telegram_id: int, is_admin: bool = False, is_super_admin: bool = False,
+                 user_context: UserContext = None):
+        self.telegram_id = telegram_id
+        self.is_admin = is_admin
+        self.is_super_admin = is_super_admin
+        self.user_context = user_context
+
+    @property
+    def user(self):
+        """The user's all_users row, None if the user is not registered"""
+        return self.user_context.user if self.user_context is not None else None
+
+    def __repr__(self):
+        return (f"Identity(telegram_id={self.telegram_id}, is_admin={self.is_admin}, "
+                f"is_super_admin={self.is_super_admin}, registered={self.user_context is not None})")
+
+
+async def get_identity(telegram_id: int, with_profile: bool = True) -> Identity:
+    """
+    Resolves roles and profile of a user.
+
+    Args:
+        telegram_id (int): ID of the user.
+        with_profile (bool, optional): Whether the user's profile is loaded as well as the roles.
+
+    Returns:
+        Identity: The user's identity.
+    """
+    user_context = None
+    if with_profile or role_catalogue.is_stale:
+        async with DatabaseManager() as db:
+            if role_catalogue.is_stale:
+                await db.load_role_catalogue()
+
+            if with_profile:
+                user_context = await db.get_user_context(telegram_id=telegram_id) or None
+
+    return Identity(telegram_id=telegram_id,
+                    is_admin=role_catalogue.is_admin(telegram_id),
+                    is_super_admin=role_catalogue.is_super_admin(telegram_id),
+                    user_context=user_context)
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """
+    Outer update middleware passing the identity of the update's user to filters and handlers. The identity is None for
+    updates without a user, e.g. channel posts.
+
+    Updates from group chats only get the user's roles, their profile is not read, since group updates are frequent
+    and handled without it.
+
+    If the identity cannot be resolved, e.g. the database is locked, the update is still handled with identity None,
+    and handlers taking the identity answer the user with texts.error_occurred instead of the update being dropped.
+    """
+    async def __call__(self, handler, event, data: dict):
+        user = data.get("event_from_user")
+        data["identity"] = None
+        if user is not None:
+            chat = data.get("event_chat")
+            try:
+                data["identity"] = await get_identity(telegram_id=user.id,
+                                                      with_profile=chat is None or chat.type == "private")
+            except Exception as e:
+                logging.error(msg=f"An error occurred during identity resolving: {e}. User {user.id}")
+
+        return await handler(event, data)
@@ -0,0 +1,422 @@
+"""
+This module contains the daily practice reminders.
+
+Reminders are sent once a day at NOTIFICATION_TIME local time of every time zone of users. Each time zone is a
+separate daily job of the scheduler, which spreads the outgoing messages and GoHighLevel calls across the day.
+
+Every reminder is recorded in the notification_journal table as planned before anything is sent, and as sent or
+failed once all its messages are finished, together with the advance of the user's missed days counter. A sweep
+interrupted by a restart is run again by the scheduler and continues with the reminders which are still planned.
+
+Small group alerts of a sweep are combined into one message per group, sent once every shard of the process is
+swept. They are tracked in the journal apart from the reminders, so a reminder is finished as soon as its own
+messages are, and a sweep resumed after a restart only sends the alerts which were not delivered. Admin alerts about
+filling main groups can be collected by admin_alerts and sent as one summary per admin instead, see
+ADMIN_ALERTS_MODE.
+
+Users due for a reminder are found through the deadlines table. Submission handlers move a user's practice deadline
+to NOTIFICATION_TIME of the day after the submitted practice, and a sweep moves expired deadlines to the next day,
+so a sweep reads only the users whose deadline has expired.
+
+A sweep is split into NOTIFICATION_SHARDS shards of users by telegram_id. Shards are claimed through leases in the
+database, so they are swept concurrently by worker tasks and by every process running the sweep, and the shard of a
+crashed worker is taken over once its lease expires. A shard which fails, e.g. because the database is locked, does
+not affect the others: it keeps its lease and is swept again after a delay, up to NOTIFICATION_SHARD_ATTEMPTS times.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, date, timedelta, timezone as dt_timezone
+from functools import partial
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bot.delivery import DeliveryJob, Digest, delivery
+from bot.keyboards import get_submit_training_kb
+from bot.main import bot
+from bot.scheduler import scheduler, DailyJob
+from bot.settings import (NOTIFICATION_TIME, NOTIFICATION_GRACE, NOTIFICATION_SHARDS, NOTIFICATION_WORKERS,
+                          NOTIFICATION_LEASE, NOTIFICATION_SHARD_ATTEMPTS, NOTIFICATION_SHARD_RETRY_DELAY)
+from bot.texts import small_group_notification_text, user_notification_for_more_days, user_notification_for_one_day
+from database.main import DatabaseManager
+from database.writer import writer
+from go_high_level.api_calls import change_stage
+
+
+# Owner of the shard leases claimed by this process
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def make_notifications(scheduled_at: datetime, timezone: str = None):
+    """
+    Sends daily notifications to users of a time zone about their non-submitted Practices of the Day (POPs).
+
+    The function is run by the scheduler once a day at NOTIFICATION_TIME local time of every time zone, see
+    schedule_notification_shards. Reminders for users who haven't submitted their practice for the local day of the
+    run are planned in the notification journal by the database, so only these users are loaded and notified, and
+    only reminders which are not finished yet are sent when the sweep is resumed.
+    For users who haven't practiced for multiple days, different notifications are sent based on the number of days
+    missed.
+    Additionally, if a user misses three or more days, their status is updated in an external system via an API call.
+    Messages are sent concurrently by the delivery pipeline within Telegram rate limits.
+
+    Users are split into NOTIFICATION_SHARDS shards, which are claimed through leases, see NotificationSweep, so
+    several processes sharing the database can run the same sweep.
+
+    Args:
+        scheduled_at (datetime): Fire time of the scheduler run.
+        timezone (str, optional): Time zone of the users to notify. Defaults to users without a time zone, who are
+            notified in the server time zone.
+    """
+    current_day = scheduled_at.astimezone(ZoneInfo(timezone) if timezone else None).date()
+
+    sweep = NotificationSweep(current_day=current_day, due_at=format_deadline(scheduled_at),
+                              next_due_at=get_deadline(day=current_day, timezone=timezone), timezone=timezone)
+    await sweep.run()
+
+
+class NotificationSweep:
+    """
+    A reminder sweep of a time zone split into shards of users by telegram_id.
+
+    A worker claims a shard through a lease in the leases table before planning and sending its reminders, renews the
+    lease while sending and marks it as done afterwards. Every process running the sweep claims the shards which are
+    free, works on up to NOTIFICATION_WORKERS of them concurrently and then waits for the shards claimed by other
+    processes, so a shard whose worker has crashed is taken over once its lease expires. Workers of a process share
+    the process-wide delivery pipeline and its rate limiter, and send the small group alerts of their shards as one
+    digest.
+
+    A shard whose sweep fails is retried by the same process with a growing delay, and given up with a failed lease
+    after max_attempts sweeps. Its users keep their expired deadlines, since planning is rolled back, so they are
+    reminded by the next sweep.
+
+    Args:
+        current_day (date): Local day the sweep runs for.
+        due_at (str): ISO UTC timestamp, practice deadlines up to it have expired.
+        next_due_at (str): ISO UTC timestamp of the next sweep.
+        timezone (str, optional): Time zone of the users to notify.
+        shards (int, optional): Amount of shards the users are split into.
+        workers (int, optional): Amount of shards swept concurrently by this process.
+        lease (timedelta, optional): Duration of a shard lease.
+        max_attempts (int, optional): How many times a failing shard is swept before it is given up.
+        retry_delay (timedelta, optional): Delay before the first retry of a failed shard.
+    """
+    def __init__(self, current_day: date, due_at: str, next_due_at: str, timezone: str = None,
+                 shards: int = NOTIFICATION_SHARDS, workers: int = NOTIFICATION_WORKERS,
+                 lease: timedelta = NOTIFICATION_LEASE, max_attempts: int = NOTIFICATION_SHARD_ATTEMPTS,
+                 retry_delay: timedelta = NOTIFICATION_SHARD_RETRY_DELAY):
+        # The amount of shards is part of the name, a sweep resumed with other shards does not reuse finished leases
+        self.name = f"notifications:{current_day}:{shards}:{timezone or ''}"
+        self.current_day = str(current_day)
+        self.due_at = due_at
+        self.next_due_at = next_due_at
+        self.timezone = timezone
+        self.shards = shards
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.failures = {}
+
+    def _get_expiry(self) -> str:
+        return format_deadline(datetime.now(dt_timezone.utc) + self.lease)
+
+    async def run(self):
+        """Sweeps shards until every shard of the sweep is done or given up. Raises RuntimeError if this process has
+        given up a shard"""
+        while True:
+            claimed = await self._claim()
+            if claimed:
+                failed = await self._sweep(claimed)
+                if failed:
+                    # Failed shards keep their leases and are claimed again by this process after the delay
+                    await asyncio.sleep((self.retry_delay * 2 ** (min(self.failures[shard] for shard in failed) - 1))
+                                        .total_seconds())
+                continue
+
+            async with DatabaseManager() as db:
+                leases = await db.get_leases(name=self.name)
+
+            running = [lease for lease in leases if lease["status"] == "running"]
+            if not running:
+                given_up = [shard for shard, failures in self.failures.items() if failures >= self.max_attempts]
+                if given_up:
+                    raise RuntimeError(f"Notification shards {given_up} of {self.name} failed "
+                                       f"{self.max_attempts} times and were given up")
+                return
+
+            # Shards of other workers are taken over if their leases expire before they are done
+            expires_at = min(datetime.fromisoformat(lease["expires_at"]) for lease in running)
+            delay = (expires_at - datetime.now(dt_timezone.utc)).total_seconds()
+            logging.info(msg=f"Notification shards {[lease['shard'] for lease in running]} of {self.name} are swept "
+                             f"by other workers, waiting")
+            await asyncio.sleep(min(max(delay, 1), self.lease.total_seconds()))
+
+    async def _claim(self) -> list:
+        """Claims every free shard and returns the claimed ones"""
+        now = format_deadline(datetime.now(dt_timezone.utc))
+        expires_at = self._get_expiry()
+        claimed = []
+        for shard in range(self.shards):
+            if self.failures.get(shard, 0) >= self.max_attempts:
+                continue
+
+            if await writer.submit("claim_lease", name=self.name, shard=shard, owner=WORKER_ID,
+                                   expires_at=expires_at, now=now):
+                claimed.append(shard)
+
+        return claimed
+
+    async def _sweep(self, shards: list) -> list:
+        """Sweeps the claimed shards, finishes leases of the swept ones and returns the failed ones which are retried"""
+        kb = await get_submit_training_kb()
+        group_alerts = Digest(send=bot.send_message)
+        semaphore = asyncio.Semaphore(self.workers)
+
+        heartbeat = asyncio.create_task(self._renew(shards))
+        try:
+            results = await asyncio.gather(*(self._sweep_shard(shard=shard, kb=kb, group_alerts=group_alerts,
+                                                               semaphore=semaphore) for shard in shards),
+                                           return_exceptions=True)
+
+            # Alerts of the swept shards are sent even if another shard has failed
+            report = await delivery.deliver(group_alerts.get_jobs(description="Small group alerts"))
+            logging.info(msg=f"Small group alerts of notification shards {shards} of {self.name} sent: {report}")
+
+        finally:
+            heartbeat.cancel()
+
+        retried = []
+        for shard, result in zip(shards, results):
+            if not isinstance(result, BaseException):
+                await writer.submit("finish_lease", name=self.name, shard=shard, owner=WORKER_ID)
+                continue
+
+            self.failures[shard] = self.failures.get(shard, 0) + 1
+            description = f"Notification shard {shard} of {self.name} (attempt {self.failures[shard]})"
+            if self.failures[shard] >= self.max_attempts:
+                logging.error(msg=f"An error occurred during notification sweep: {result}. {description} is given up")
+                await writer.submit("fail_lease", name=self.name, shard=shard, owner=WORKER_ID)
+            else:
+                logging.error(msg=f"An error occurred during notification sweep: {result}. {description} is retried")
+                retried.append(shard)
+
+        return retried
+
+    async def _sweep_shard(self, shard: int, kb, group_alerts: Digest, semaphore: asyncio.Semaphore):
+        """Plans and sends reminders of a shard"""
+        async with semaphore:
+            async with DatabaseManager() as db:
+                planned_users = await db.plan_notifications(current_day=self.current_day,
+                                                            due_at=self.due_at,
+                                                            next_due_at=self.next_due_at,
+                                                            timezone=self.timezone,
+                                                            shard=shard,
+                                                            shards=self.shards)
+
+            jobs = []
+            for user in planned_users:
+                jobs.extend(get_notification_jobs(user=user, kb=kb, sweep_date=self.current_day,
+                                                  group_alerts=group_alerts))
+
+            report = await delivery.deliver(jobs)
+            logging.info(msg=f"Notifications for {len(planned_users)} users ({self.timezone or 'server time zone'}, "
+                             f"shard {shard + 1}/{self.shards}) sent: {report}")
+
+    async def _renew(self, shards: list):
+        """Renews leases of the claimed shards until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            for shard in shards:
+                try:
+                    if not await writer.submit("renew_lease", name=self.name, shard=shard, owner=WORKER_ID,
+                                               expires_at=self._get_expiry()):
+                        logging.warning(msg=f"Lease of notification shard {shard} of {self.name} was taken over")
+
+                except Exception as e:
+                    logging.error(msg=f"An error occurred during renewal of notification shard {shard} lease: {e}")
+
+
+def format_deadline(moment: datetime) -> str:
+    """Returns the aware datetime as an ISO UTC timestamp stored in the deadlines table"""
+    return moment.astimezone(dt_timezone.utc).isoformat(timespec="seconds")
+
+
+def get_deadline(day, timezone: str = None) -> str:
+    """
+    Returns the practice deadline of a user who has submitted a practice for the day, which is the reminder time of
+    the next day in the user's time zone.
+
+    Args:
+        day (date | str): Day of the submitted practice, ISO string or date.
+        timezone (str, optional): The user's own or program time zone. Defaults to the server time zone.
+
+    Returns:
+        str: ISO UTC timestamp of the deadline.
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+
+    deadline = datetime.combine(day + timedelta(days=1), NOTIFICATION_TIME)
+    if timezone:
+        try:
+            deadline = deadline.replace(tzinfo=ZoneInfo(timezone))
+        except (ZoneInfoNotFoundError, ValueError):
+            # Unknown time zones have no notification job, see schedule_notification_shards, server time is kept
+            pass
+
+    return format_deadline(deadline)
+
+
+async def schedule_notification_shards(scheduled_at: datetime = None):
+    """
+    Registers a daily notification job for every time zone of users, so reminders go out at local noon of each time
+    zone instead of in one burst. Users without a time zone of their own or of their program are notified in the
+    server time zone.
+
+    The function is run at startup and then periodically by the scheduler, so time zones of new users and programs
+    get their job.
+
+    Args:
+        scheduled_at (datetime, optional): Fire time of the scheduler run.
+    """
+    async with DatabaseManager() as db:
+        timezones = await db.get_notification_timezones()
+
+    for timezone in {None, *timezones}:
+        name = f"notifications:{timezone}" if timezone else "notifications"
+        if name in scheduler.jobs:
+            continue
+
+        try:
+            tz = ZoneInfo(timezone) if timezone else None
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            logging.error(msg=f"An error occurred during notifications scheduling: {e}. Unknown time zone {timezone}")
+            continue
+
+        scheduler.add_job(DailyJob(name=name, func=partial(make_notifications, timezone=timezone),
+                                   at=NOTIFICATION_TIME, tz=tz, grace=NOTIFICATION_GRACE))
+
+
+class NotificationOutcome:
+    """
+    Collects results of the delivery jobs of a user's reminder, i.e. the message to the user and the GoHighLevel stage
+    change, and finishes its journal entry once all of them are done. The reminder is sent if the message to the user
+    has been delivered. The small group alert is finished on its own, see finish_group_alert.
+
+    Args:
+        sweep_date (str): ISO date of the sweep.
+        telegram_id (int): User the reminder is sent to.
+    """
+    __slots__ = ("sweep_date", "telegram_id", "pending", "sent")
+
+    def __init__(self, sweep_date: str, telegram_id: int):
+        self.sweep_date = sweep_date
+        self.telegram_id = telegram_id
+        self.pending = 0
+        self.sent = False
+
+    def track(self, primary: bool = False):
+        """Returns on_done callback of a delivery job of the reminder"""
+        self.pending += 1
+        return partial(self.done, primary=primary)
+
+    async def done(self, ok: bool, primary: bool = False):
+        if primary:
+            self.sent = ok
+
+        self.pending -= 1
+        if self.pending == 0:
+            await writer.submit("finish_notification", sweep_date=self.sweep_date, telegram_id=self.telegram_id,
+                                status="sent" if self.sent else "failed")
+
+
+def get_notification_jobs(user, kb, sweep_date: str, group_alerts: Digest) -> list:
+    """
+    Returns delivery jobs of the reminder for a user who has not submitted a Practice of the Day (POP) for current day.
+
+    Args:
+        user (Record): The user's row returned by DatabaseManager.plan_notifications, missed_days is the advanced
+            counter of days without practice.
+        kb (InlineKeyboardMarkup): Keyboard for submitting the practice attached to the reminder.
+        sweep_date (str): ISO date of the sweep, the key of the user's journal entry.
+        group_alerts (Digest): Digest the small group alert is added to, so a group gets one message per sweep.
+
+    Returns:
+        list: DeliveryJob objects of the reminder and the GoHighLevel stage change, empty if only the small group
+            alert of the reminder is left. The alert is added to group_alerts.
+    """
+    missed_days = user["missed_days"]
+    description = f"User {user['first_name']} ({user['telegram_id']})"
+    jobs = []
+
+    # A reminder finished before a restart only has its group alert left
+    if user["status"] == "planned":
+        outcome = NotificationOutcome(sweep_date=sweep_date, telegram_id=user["telegram_id"])
+
+        if missed_days == 1:
+            text = user_notification_for_one_day
+        else:
+            text = user_notification_for_more_days.format(missed_days)
+
+        jobs.append(DeliveryJob(action=partial(bot.send_message, text=text, chat_id=user["telegram_id"],
+                                               reply_markup=kb),
+                                chat_id=user["telegram_id"],
+                                description=description,
+                                on_done=outcome.track(primary=True)))
+
+        if missed_days == 3:
+            jobs.append(DeliveryJob(action=partial(change_stage,
+                                                   opportunity_id=user["ghl_opp_id"],
+                                                   stage_id=user["ghl_no_pop_id"],
+                                                   pipeline_id=user["ghl_pipeline_id"]),
+                                    description=description,
+                                    on_done=outcome.track()))
+
+    if user["group_alert"] == "pending":
+        group_alerts.add(chat_id=user["small_group_id"],
+                         text=small_group_notification_text.format(user["first_name"], missed_days),
+                         on_done=partial(finish_group_alert, sweep_date, user["telegram_id"]))
+
+    return jobs
+
+
+async def finish_group_alert(sweep_date: str, telegram_id: int, ok: bool):
+    """Records the delivery result of a user's small group alert in the notification journal"""
+    await writer.submit("finish_group_alert", sweep_date=sweep_date, telegram_id=telegram_id,
+                        status="sent" if ok else "failed")
+
+
+class AdminAlertSummary:
+    """
+    Admin alerts about main groups collected between summaries. Only the latest alert of a group is kept, so a summary
+    contains one line per group with its current state.
+    """
+    def __init__(self):
+        self.alerts = {}
+
+    def add(self, group_id: int, text: str):
+        """Stores the alert of the group until the next summary"""
+        self.alerts[group_id] = text
+
+    async def send_summary(self, scheduled_at: datetime = None):
+        """Sends the collected alerts to every admin in one message. Run periodically by the scheduler"""
+        if not self.alerts:
+            return
+
+        alerts, self.alerts = self.alerts, {}
+
+        async with DatabaseManager() as db:
+            all_admins = await db.get_all_table_data(table_name="admins")
+
+        summary = Digest(send=bot.send_message)
+        for admin in all_admins:
+            for text in alerts.values():
+                summary.add(chat_id=admin["telegram_id"], text=text)
+
+        report = await delivery.deliver(summary.get_jobs(description="Admin alerts summary"))
+        logging.info(msg=f"Admin alerts summary of {len(alerts)} groups sent: {report}")
+
+
+admin_alerts = AdminAlertSummary()
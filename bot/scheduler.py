@@ -0,0 +1,214 @@
+"""
+This module contains the scheduler running the bot's periodic jobs.
+
+The scheduler computes the next fire time of every job and sleeps exactly until the earliest one, instead of polling
+the clock. The fire time of each job's last run is stored in the scheduler_runs table, so after a restart a run which
+was missed while the process was down is caught up once if it is not older than the job's grace period, and skipped
+otherwise. A run interrupted by a restart is started again with the same fire time within the grace period as well,
+so jobs with a grace period have to be safe to resume. A job whose previous run is still in progress is not started
+again.
+
+Classes:
+    - Job: Base class of scheduled jobs.
+    - DailyJob: A job running every day at a given time of day.
+    - IntervalJob: A job running with a fixed interval.
+    - Scheduler: Runs the registered jobs.
+
+Attributes:
+    scheduler (Scheduler): The process-wide scheduler.
+
+Example:
+    scheduler.add_job(DailyJob(name="notifications", func=make_notifications, at=time(12)))
+    await scheduler.run()
+"""
+
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone, time
+
+from database.main import DatabaseManager
+from database.writer import writer
+
+
+class Job(ABC):
+    """
+    Base class of scheduled jobs. Subclasses implement get_next_run.
+
+    Args:
+        name (str): Unique job name, used as the key of the job's scheduler_runs row.
+        func (callable): Coroutine function called with the fire time (aware datetime) of the run.
+        grace (timedelta, optional): How late a missed run may still be caught up. Defaults to no catch-up.
+    """
+    def __init__(self, name: str, func, grace: timedelta = timedelta(0)):
+        self.name = name
+        self.func = func
+        self.grace = grace
+
+    @abstractmethod
+    def get_next_run(self, after: datetime) -> datetime:
+        """Returns the first fire time later than after"""
+
+
+class DailyJob(Job):
+    """
+    A job running every day at a given time of day.
+
+    Args:
+        at (time): Time of day of the run.
+        tz (tzinfo, optional): Time zone of the time of day. Defaults to the server time zone.
+    """
+    def __init__(self, name: str, func, at: time, tz=None, grace: timedelta = timedelta(0)):
+        super().__init__(name=name, func=func, grace=grace)
+        self.at = at
+        self.tz = tz
+
+    def _localize(self, day, at: time) -> datetime:
+        if self.tz is None:
+            # A naive datetime is interpreted in the server time zone, including its DST rules
+            return datetime.combine(day, at).astimezone()
+
+        return datetime.combine(day, at, tzinfo=self.tz)
+
+    def get_next_run(self, after: datetime) -> datetime:
+        day = after.astimezone(self.tz).date()
+        while True:
+            fire_time = self._localize(day, self.at)
+            if fire_time > after:
+                return fire_time
+
+            day += timedelta(days=1)
+
+
+class IntervalJob(Job):
+    """
+    A job running with a fixed interval.
+
+    Args:
+        interval (timedelta): Time between the fire times of two runs.
+    """
+    def __init__(self, name: str, func, interval: timedelta, grace: timedelta = timedelta(0)):
+        super().__init__(name=name, func=func, grace=grace)
+        self.interval = interval
+
+    def get_next_run(self, after: datetime) -> datetime:
+        return after + self.interval
+
+
+class Scheduler:
+    """Runs the registered jobs at their fire times"""
+    def __init__(self):
+        self.jobs = {}
+        self._next_runs = {}
+        self._running = {}
+        self._changed = None
+
+    def add_job(self, job: Job):
+        """Registers the job, a running scheduler picks it up immediately"""
+        self.jobs[job.name] = job
+        self._next_runs.pop(job.name, None)
+        if self._changed is not None:
+            self._changed.set()
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def _get_first_run(self, job: Job, now: datetime) -> datetime:
+        """Returns fire time of the job's first run after startup, which is in the past for a run to catch up"""
+        async with DatabaseManager() as db:
+            last_run = await db.get_job_run(job_name=job.name)
+
+        if not last_run:
+            return job.get_next_run(after=now)
+
+        last_fire_time = datetime.fromisoformat(last_run["scheduled_at"])
+        if last_run["status"] == "running" and now - last_fire_time <= job.grace:
+            logging.warning(msg=f"Scheduled job {job.name} was interrupted in its run at {last_fire_time}, resuming")
+            return last_fire_time
+
+        missed_run = None
+        fire_time = job.get_next_run(after=last_fire_time)
+        while fire_time <= now:
+            missed_run = fire_time
+            fire_time = job.get_next_run(after=fire_time)
+
+        if missed_run is None:
+            return fire_time
+
+        # Several missed runs are caught up as one run of the latest of them
+        if now - missed_run <= job.grace:
+            logging.warning(msg=f"Scheduled job {job.name} missed its run at {missed_run}, catching up")
+            return missed_run
+
+        logging.warning(msg=f"Scheduled job {job.name} missed its run at {missed_run}, next run at {fire_time}")
+        return fire_time
+
+    async def run(self):
+        """Runs jobs at their fire times until cancelled"""
+        self._changed = asyncio.Event()
+        try:
+            while True:
+                now = self._now()
+                for name, job in self.jobs.items():
+                    if name not in self._next_runs:
+                        self._next_runs[name] = await self._get_first_run(job=job, now=now)
+
+                for name, fire_time in list(self._next_runs.items()):
+                    if fire_time <= now:
+                        job = self.jobs[name]
+                        self._start(job=job, fire_time=fire_time)
+                        self._next_runs[name] = job.get_next_run(after=max(fire_time, now))
+
+                self._changed.clear()
+                if not self._next_runs:
+                    await self._changed.wait()
+                    continue
+
+                delay = (min(self._next_runs.values()) - self._now()).total_seconds()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+        finally:
+            for task in self._running.values():
+                task.cancel()
+
+    def _start(self, job: Job, fire_time: datetime):
+        """Starts a run of the job unless its previous run is still in progress"""
+        previous = self._running.get(job.name)
+        if previous is not None and not previous.done():
+            logging.warning(msg=f"Scheduled job {job.name} skipped its run at {fire_time}, previous run is in progress")
+            return
+
+        self._running[job.name] = asyncio.create_task(self._execute(job=job, fire_time=fire_time))
+
+    @staticmethod
+    async def _execute(job: Job, fire_time: datetime):
+        """Runs the job and records the run in scheduler_runs"""
+        try:
+            # The run is recorded before it starts, so a run interrupted by a restart is known after the restart
+            await writer.submit("save_job_run", job_name=job.name,
+                                data={"scheduled_at": fire_time.isoformat(),
+                                      "started_at": datetime.now(timezone.utc).isoformat(),
+                                      "finished_at": None,
+                                      "status": "running"})
+            try:
+                await job.func(fire_time)
+                status = "done"
+            except Exception as e:
+                logging.error(msg=f"An error occurred during scheduled job {job.name}: {e}")
+                status = "failed"
+
+            await writer.submit("save_job_run", job_name=job.name,
+                                data={"finished_at": datetime.now(timezone.utc).isoformat(),
+                                      "status": status})
+
+        except Exception as e:
+            logging.error(msg=f"An error occurred during recording of scheduled job {job.name}: {e}")
+
+
+scheduler = Scheduler()
@@ -15,6 +15,31 @@ Attributes:
     API_ID (str): The API ID for Telegram API access, retrieved from the environment variables.
     API_HASH (str): The API Hash for Telegram API access, retrieved from the environment variables.
     TELETHON_ID (str): The session identifier for Telethon, retrieved from the environment variables.
+    NOTIFICATION_TIME (time): Local time of day the daily practice reminders are sent at in every time zone.
+    NOTIFICATION_GRACE (timedelta): How late reminders missed during downtime are still sent after a restart.
+    NOTIFICATION_SHARDS (int): Amount of shards the users of a reminder sweep are split into by telegram_id.
+    NOTIFICATION_WORKERS (int): Amount of shards of a sweep a process works on concurrently.
+    NOTIFICATION_LEASE (timedelta): How long a claimed shard stays with its worker without renewal, a shard of a
+        crashed worker is taken over once its lease expires.
+    NOTIFICATION_SHARD_ATTEMPTS (int): How many times a worker sweeps a shard which fails, e.g. because the database
+        is locked, before the shard is given up for the day.
+    NOTIFICATION_SHARD_RETRY_DELAY (timedelta): Delay before a failed shard is swept again, doubled with every
+        further attempt.
+    ADMIN_ALERTS_MODE (str): "instant" sends admins an alert about a filling main group on every join, "summary"
+        sends one summary of the latest state of every such group each ADMIN_SUMMARY_INTERVAL.
+    ADMIN_SUMMARY_INTERVAL (timedelta): Interval of admin alert summaries.
+    DELIVERY_CONCURRENCY (int): Amount of concurrent senders of the notification delivery pipeline.
+    DELIVERY_MAX_RETRIES (int): How many times a message rejected with a flood limit error is rescheduled.
+    GLOBAL_MESSAGES_PER_SECOND (float): Telegram limit of messages sent by the bot per second.
+    CHAT_MESSAGES_PER_SECOND (float): Telegram limit of messages sent to a single chat per second.
+    GROUP_MESSAGES_PER_MINUTE (float): Telegram limit of messages sent to a single group per minute.
+    GLOBAL_TOKEN_BATCH (int): Amount of tokens of the bot-wide limit a process takes from the database at once.
+    JOB_WORKERS (int): Amount of background jobs run concurrently.
+    JOB_MAX_ATTEMPTS (int): How many times a failing background job is run before it is marked as failed.
+    JOB_RETRY_BACKOFF (timedelta): Delay before the first retry of a failed job, doubled with every further attempt.
+    JOB_LEASE (timedelta): How long a started job is reserved for its run, a job of a crashed process is run again
+        once its lease expires.
+    JOB_POLL_INTERVAL (timedelta): How often the job queue checks for retries which have become due.
 
 Raises:
     KeyError: If any required environment variables are missing, a KeyError is raised with a critical log message.
@@ -25,6 +50,7 @@ Make sure to create .env file!
 
 import logging
 import os
+from datetime import time, timedelta
 from dotenv import load_dotenv
 
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.WARNING)
@@ -38,3 +64,24 @@ try:
 except KeyError as err:
     logging.critical(f"Can't read token from environment variable. Message: {err}")
     raise KeyError(err)
+
+NOTIFICATION_TIME = time.fromisoformat(os.environ.get("NOTIFICATION_TIME", "12:00"))
+NOTIFICATION_GRACE = timedelta(hours=float(os.environ.get("NOTIFICATION_GRACE_HOURS", 6)))
+NOTIFICATION_SHARDS = int(os.environ.get("NOTIFICATION_SHARDS", 4))
+NOTIFICATION_WORKERS = int(os.environ.get("NOTIFICATION_WORKERS", NOTIFICATION_SHARDS))
+NOTIFICATION_LEASE = timedelta(seconds=float(os.environ.get("NOTIFICATION_LEASE_SECONDS", 300)))
+NOTIFICATION_SHARD_ATTEMPTS = int(os.environ.get("NOTIFICATION_SHARD_ATTEMPTS", 3))
+NOTIFICATION_SHARD_RETRY_DELAY = timedelta(seconds=float(os.environ.get("NOTIFICATION_SHARD_RETRY_DELAY_SECONDS", 5)))
+ADMIN_ALERTS_MODE = os.environ.get("ADMIN_ALERTS_MODE", "instant")
+ADMIN_SUMMARY_INTERVAL = timedelta(minutes=float(os.environ.get("ADMIN_SUMMARY_INTERVAL_MINUTES", 60)))
+DELIVERY_CONCURRENCY = int(os.environ.get("DELIVERY_CONCURRENCY", 16))
+DELIVERY_MAX_RETRIES = int(os.environ.get("DELIVERY_MAX_RETRIES", 3))
+GLOBAL_MESSAGES_PER_SECOND = float(os.environ.get("GLOBAL_MESSAGES_PER_SECOND", 30))
+CHAT_MESSAGES_PER_SECOND = float(os.environ.get("CHAT_MESSAGES_PER_SECOND", 1))
+GROUP_MESSAGES_PER_MINUTE = float(os.environ.get("GROUP_MESSAGES_PER_MINUTE", 20))
+GLOBAL_TOKEN_BATCH = int(os.environ.get("GLOBAL_TOKEN_BATCH", 5))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BACKOFF = timedelta(seconds=float(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 5)))
+JOB_LEASE = timedelta(seconds=float(os.environ.get("JOB_LEASE_SECONDS", 300)))
+JOB_POLL_INTERVAL = timedelta(seconds=float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", 1)))
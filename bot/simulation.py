@@ -0,0 +1,274 @@
+"""
+This module contains the simulation mode of the daily practice reminder sweep.
+
+The simulation runs the full sweep of bot.notifications against a temporary database filled with a synthetic all_users
+population, without sending real messages. Telegram requests go through a fake aiogram session and GoHighLevel stage
+changes through a fake client, both recording the calls and answering after a configurable latency. At the end a
+benchmark report with wall time, time spent in the database, sends per second and peak memory is printed.
+
+Usage:
+    python -m bot.simulation --users 10000 --practiced-today 0.6 --max-missed-days 7 --latency 0.05
+
+Classes:
+    - FakeSession: aiogram session recording requests instead of sending them.
+    - FakeGoHighLevel: GoHighLevel client recording stage changes instead of sending them.
+    - SimulationReport: Benchmark report of a simulated sweep.
+
+Functions:
+    - populate(db, ...): Fills the database with a synthetic population.
+    - run_simulation(...): Runs the sweep and returns the report.
+"""
+
+
+import os
+
+# The bot settings require credentials, the simulation never connects to Telegram
+os.environ.setdefault("TRAINING_BOT_TOKEN", "0:simulation")
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "simulation")
+os.environ.setdefault("TELETHON_ID", "0")
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+import bot.notifications as notifications
+from bot.delivery import delivery, RateLimiter
+from bot.main import bot
+from bot.settings import CHAT_MESSAGES_PER_SECOND, GROUP_MESSAGES_PER_MINUTE, GLOBAL_MESSAGES_PER_SECOND
+from database.main import DatabaseManager
+from database.pool import pool
+from database.stats import query_stats
+from database.writer import writer
+
+
+class FakeSession(BaseSession):
+    """
+    aiogram session recording requests instead of sending them.
+
+    Args:
+        latency (float): Seconds every request takes.
+    """
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        chat_id = getattr(method, "chat_id", None)
+        self.requests.append((type(method).__name__, chat_id, time.perf_counter()))
+
+        return Message(message_id=len(self.requests),
+                       date=datetime.now(timezone.utc),
+                       chat=Chat(id=chat_id or 0, type="private" if (chat_id or 0) > 0 else "group"),
+                       text=getattr(method, "text", None))
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class FakeGoHighLevel:
+    """
+    GoHighLevel client recording stage changes instead of sending them.
+
+    Args:
+        latency (float): Seconds every call takes.
+    """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = []
+
+    async def change_stage(self, opportunity_id: str, stage_id: str, pipeline_id):
+        await asyncio.sleep(self.latency)
+        self.calls.append((opportunity_id, stage_id, pipeline_id))
+
+
+class SimulationReport:
+    """
+    Benchmark report of a simulated sweep.
+
+    Attributes:
+        users (int): Size of the synthetic population.
+        notified (int): Amount of users the sweep planned a reminder for.
+        telegram_requests (int): Amount of requests sent through the fake session.
+        ghl_calls (int): Amount of calls made through the fake GoHighLevel client.
+        wall_time (float): Seconds the sweep took.
+        db_time (float): Seconds spent executing statements, taken from query_stats.
+        sends_per_second (float): Telegram requests per second of wall time.
+        peak_memory (int): Peak of memory allocated by Python during the sweep, in bytes.
+        slowest_queries (dict): Query shapes with the largest total time and their statistics.
+    """
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    def __str__(self):
+        lines = [f"Users:               {self.users}",
+                 f"Notified users:      {self.notified}",
+                 f"Telegram requests:   {self.telegram_requests}",
+                 f"GoHighLevel calls:   {self.ghl_calls}",
+                 f"Wall time:           {self.wall_time:.2f}s",
+                 f"DB time:             {self.db_time:.2f}s",
+                 f"Sends per second:    {self.sends_per_second:.1f}",
+                 f"Peak memory:         {self.peak_memory / 1024 / 1024:.1f} MiB",
+                 "Slowest query shapes:"]
+        for shape, stats in self.slowest_queries.items():
+            lines.append(f"  {stats['total_time']:.3f}s in {stats['count']} runs: {shape[:100]}")
+
+        return "\n".join(lines)
+
+
+async def populate(db: DatabaseManager, users: int, practiced_today: float, max_missed_days: int, programs: int,
+                   users_per_group: int, current_day, seed: int = 0):
+    """
+    Fills the database with a synthetic population.
+
+    Args:
+        db (DatabaseManager): Session of the simulation database.
+        users (int): Amount of users.
+        practiced_today (float): Share of users who have submitted a practice for the current day.
+        max_missed_days (int): Other users have missed between 1 and max_missed_days days, half of them are stored
+            with the date of their last practice and half with a day counter.
+        programs (int): Amount of programs the users are spread over.
+        users_per_group (int): Amount of users sharing a small group.
+        current_day (date): Day of the simulated sweep.
+        seed (int, optional): Seed of the random generator.
+    """
+    generator = random.Random(seed)
+
+    await db.bulk_insert(table_name="programs",
+                         rows=[{"program_name": f"Program {number}",
+                                "ghl_pipeline_id": f"pipeline-{number}",
+                                "ghl_students_id": f"students-{number}",
+                                "ghl_no_pop_id": f"no-pop-{number}"} for number in range(1, programs + 1)])
+
+    user_rows = []
+    deadline_rows = []
+    for number in range(1, users + 1):
+        if generator.random() < practiced_today:
+            last_practice = str(current_day)
+            due_at = notifications.get_deadline(day=current_day)
+        else:
+            missed_days = generator.randint(1, max_missed_days)
+            if generator.random() < 0.5:
+                last_practice = str(current_day - timedelta(days=missed_days))
+            else:
+                last_practice = missed_days
+            due_at = "1970-01-01T00:00:00+00:00"
+
+        user_rows.append({"telegram_id": number,
+                          "first_name": f"User {number}",
+                          "small_group_id": -(number // users_per_group + 1),
+                          "main_group_id": -1,
+                          "privacy": "Public",
+                          "last_practice": last_practice,
+                          "ghl_opp_id": f"opportunity-{number}",
+                          "user_program": generator.randint(1, programs)})
+        deadline_rows.append({"telegram_id": number, "kind": "practice", "due_at": due_at})
+
+    await db.bulk_insert(table_name="all_users", rows=user_rows)
+    await db.bulk_insert(table_name="deadlines", rows=deadline_rows)
+
+
+async def run_simulation(users: int, practiced_today: float, max_missed_days: int, programs: int,
+                         users_per_group: int, latency: float, ghl_latency: float, rate_limits: bool,
+                         seed: int = 0) -> SimulationReport:
+    """Runs the reminder sweep against a synthetic population and returns the benchmark report"""
+    session = FakeSession(latency=latency)
+    ghl = FakeGoHighLevel(latency=ghl_latency)
+    bot.session = session
+    notifications.change_stage = ghl.change_stage
+    if not rate_limits:
+        delivery.limiter = RateLimiter(global_rate=1e9, chat_rate=1e9, group_rate=1e9)
+    else:
+        delivery.limiter = RateLimiter(global_rate=GLOBAL_MESSAGES_PER_SECOND, chat_rate=CHAT_MESSAGES_PER_SECOND,
+                                       group_rate=GROUP_MESSAGES_PER_MINUTE)
+
+    scheduled_at = datetime.now().astimezone()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pool.configure(db_name=os.path.join(directory, "simulation.db"), size=2)
+        writer.start()
+        try:
+            async with DatabaseManager() as db:
+                await db.migrate()
+                await populate(db=db, users=users, practiced_today=practiced_today, max_missed_days=max_missed_days,
+                               programs=programs, users_per_group=users_per_group,
+                               current_day=scheduled_at.date(), seed=seed)
+
+            query_stats.reset()
+            tracemalloc.start()
+            started = time.perf_counter()
+
+            await notifications.make_notifications(scheduled_at=scheduled_at)
+
+            wall_time = time.perf_counter() - started
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            async with DatabaseManager() as db:
+                notified = (await db.custom_query("""SELECT COUNT(*) AS notified FROM notification_journal
+                                                     WHERE status != 'skipped'"""))[0]["notified"]
+
+        finally:
+            await writer.stop()
+            await pool.close()
+
+    snapshot = query_stats.snapshot()
+    slowest_queries = dict(list(snapshot["shapes"].items())[:5])
+
+    return SimulationReport(users=users,
+                            notified=notified,
+                            telegram_requests=len(session.requests),
+                            ghl_calls=len(ghl.calls),
+                            wall_time=wall_time,
+                            db_time=sum(stats["total_time"] for stats in snapshot["shapes"].values()),
+                            sends_per_second=len(session.requests) / wall_time if wall_time else 0.0,
+                            peak_memory=peak_memory,
+                            slowest_queries=slowest_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates the daily practice reminder sweep and reports benchmarks.")
+    parser.add_argument("--users", type=int, default=10000, help="size of the synthetic population")
+    parser.add_argument("--practiced-today", type=float, default=0.6,
+                        help="share of users who have submitted a practice for the day")
+    parser.add_argument("--max-missed-days", type=int, default=7, help="maximum of days missed by other users")
+    parser.add_argument("--programs", type=int, default=3, help="amount of programs")
+    parser.add_argument("--users-per-group", type=int, default=1, help="amount of users sharing a small group")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds a Telegram request takes")
+    parser.add_argument("--ghl-latency", type=float, default=0.2, help="seconds a GoHighLevel call takes")
+    parser.add_argument("--no-rate-limits", action="store_true", help="send without Telegram rate limits")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic population")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_simulation(users=args.users,
+                                        practiced_today=args.practiced_today,
+                                        max_missed_days=args.max_missed_days,
+                                        programs=args.programs,
+                                        users_per_group=args.users_per_group,
+                                        latency=args.latency,
+                                        ghl_latency=args.ghl_latency,
+                                        rate_limits=not args.no_rate_limits,
+                                        seed=args.seed))
+
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report)
+
+
+if __name__ == "__main__":
+    main()
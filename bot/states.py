@@ -87,12 +87,14 @@ class AdminProgramState(StatesGroup):
     States:
         new_program_title: State to capture the title of the new program.
         new_program_end_time: State to capture the end time of the new program.
+        new_program_timezone: State to capture the time zone the new program's users are reminded in.
         new_program_group_title: State to capture the group title associated with the new program.
         new_program_spreadsheet: State to capture the spreadsheet details of the new program.
         new_program_confirm: State for confirming the creation of the new program.
     """
     new_program_title = State()
     new_program_end_time = State()
+    new_program_timezone = State()
     new_program_group_title = State()
     new_program_spreadsheet = State()
     new_program_confirm = State()
@@ -0,0 +1,120 @@
+"""
+This module contains the background jobs run after a user's submission of a homework or a practice has been accepted.
+
+The submission handlers reply to the user right away and hand forwarding to groups, saving to the spreadsheet, the
+GoHighLevel stage change and recording of the submission to the job queue, see bot.jobs. Every side effect is a job
+of its own, so a retry of a failing one does not repeat the others.
+
+The submission is forwarded or sent to all its chats, i.e. the Telethon account and the user's groups, by one fan-out
+job sending to every chat at once. Only chats the delivery to which has failed are retried.
+
+Functions:
+    - get_homework_jobs(...): Returns jobs of a submitted homework.
+    - get_video_jobs(...): Returns jobs of a submitted practice video.
+"""
+
+
+from bot.delivery import fan_out
+from bot.jobs import job_queue, PartialFailure
+from bot.main import bot
+from bot.notifications import get_deadline
+from bot.settings import TELETHON_ID
+from database.writer import writer
+from go_high_level.api_calls import change_stage
+from google_spreadsheets.functions import save_data_to_sheet
+
+
+@job_queue.job("fan_out")
+async def send_to_chats(method: str, destinations: list):
+    """Performs the bot method, e.g. forward_message, for every pair of chat ID and keyword arguments concurrently.
+    Raises PartialFailure with the failed destinations"""
+    results = await fan_out(send=getattr(bot, method), destinations=dict(destinations), description=method)
+
+    failed = [[chat_id, kwargs] for chat_id, kwargs in destinations if not results[chat_id]]
+    if failed:
+        raise PartialFailure(f"{method} to chats {[chat_id for chat_id, _ in failed]} failed",
+                             payload={"method": method, "destinations": failed})
+
+
+@job_queue.job("save_data_to_sheet")
+async def save_to_sheet(data: list, spreadsheet: str, homework: bool = False):
+    await save_data_to_sheet(data=data, spreadsheet=spreadsheet, homework=homework)
+
+
+@job_queue.job("change_stage")
+async def change_opportunity_stage(opportunity_id: str, stage_id: str, pipeline_id: str):
+    await change_stage(opportunity_id=opportunity_id, stage_id=stage_id, pipeline_id=pipeline_id)
+
+
+@job_queue.job("save_submission")
+async def save_submission(telegram_id: int, kind: str, day: str, timezone: str = None):
+    """Writes the day of the user's last homework or practice. A practice also moves the user's practice deadline,
+    which the reminder sweep reads"""
+    await writer.update_data(table_name="all_users", data={f"last_{kind}": day}, telegram_id=telegram_id)
+    if kind == "practice":
+        await writer.set_deadline(telegram_id=telegram_id, kind=kind, due_at=get_deadline(day=day, timezone=timezone))
+
+
+def get_homework_jobs(user_context, message_id: int, sheet_data: list, day: str) -> list:
+    """
+    Returns jobs of a submitted homework.
+
+    Args:
+        user_context (UserContext): The submitting user.
+        message_id (int): The user's message with the homework, forwarded to the user's groups.
+        sheet_data (list): Row saved to the homework sheet of the user's main group.
+        day (str): ISO date of the homework.
+
+    Returns:
+        list: Tuples of job kind and payload for JobQueue.enqueue.
+    """
+    user = user_context.user
+    chats = [user["small_group_id"]]
+    if user["privacy"] == "Public":
+        chats.append(user["main_group_id"])
+
+    message = {"from_chat_id": user["telegram_id"], "message_id": message_id}
+    jobs = [("fan_out", {"method": "forward_message", "destinations": [[chat_id, message] for chat_id in chats]})]
+    jobs.append(("save_data_to_sheet", {"data": sheet_data,
+                                        "spreadsheet": user_context.group["group_spreadsheet_id"],
+                                        "homework": True}))
+    jobs.append(("save_submission", {"telegram_id": user["telegram_id"], "kind": "homework", "day": day,
+                                     "timezone": user_context.timezone}))
+
+    return jobs
+
+
+def get_video_jobs(user_context, video: str, telethon_caption: str, caption: str, day: str) -> list:
+    """
+    Returns jobs of a submitted practice video.
+
+    Args:
+        user_context (UserContext): The submitting user.
+        video (str): File ID of the video.
+        telethon_caption (str): Caption of the video sent to the Telethon account, which saves it to the drive.
+        caption (str): Caption of the video sent to the user's groups.
+        day (str): ISO date of the practice.
+
+    Returns:
+        list: Tuples of job kind and payload for JobQueue.enqueue.
+    """
+    user = user_context.user
+    program = user_context.program
+
+    destinations = [[int(TELETHON_ID), {"video": video, "caption": telethon_caption}],
+                    [user["small_group_id"], {"video": video, "caption": caption}]]
+    if user["privacy"] == "Public":
+        destinations.append([user["main_group_id"], {"video": video, "caption": caption}])
+
+    jobs = [("fan_out", {"method": "send_video", "destinations": destinations})]
+
+    # A user returning after three or more missed days is moved back to the students stage
+    if str(user["last_practice"]).isdigit() and user["last_practice"] >= 3:
+        jobs.append(("change_stage", {"opportunity_id": user["ghl_opp_id"],
+                                      "stage_id": program["ghl_students_id"],
+                                      "pipeline_id": program["ghl_pipeline_id"]}))
+
+    jobs.append(("save_submission", {"telegram_id": user["telegram_id"], "kind": "practice", "day": day,
+                                     "timezone": user_context.timezone}))
+
+    return jobs
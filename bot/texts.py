@@ -35,6 +35,8 @@ Messages:
 - program_name: Prompt to enter the title of a program.
 - program_end_date: Prompt to enter the end date of a program.
 - incorrect_format_of_end_date: Message for incorrect end date format.
+- program_timezone: Prompt to enter the IANA time zone of a program, e.g. Europe/Berlin, or "-" for the server one.
+- incorrect_timezone: Message for an unknown time zone.
 - provide_title_of_group: Prompt to provide the title of the main group.
 - invite_bot: Prompt to invite the bot to the main group.
 - provide_spreadsheet_id: Prompt to provide the spreadsheet ID of a program.
@@ -126,6 +128,10 @@ program_end_date = " "
 
 incorrect_format_of_end_date = " "
 
+program_timezone = " "
+
+incorrect_timezone = " "
+
 provide_title_of_group = " "
 
 invite_bot = " "
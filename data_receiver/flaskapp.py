@@ -14,8 +14,11 @@ This application is designed to handle Kajabi webhook events and store subscribe
 """
 
 
+import asyncio
+
 from flask import Flask, request, jsonify
 from database.main import DatabaseManager
+from database.writer import writer
 
 app = Flask(__name__)
 
@@ -54,14 +57,20 @@ async def kajabi_webhook():
                        "last_name": member_last_name,
                        "program_title": offer_title}
 
-        async with DatabaseManager("test.db") as db:
-            await db.insert_data(table_name="subscribers", data=member_data)
+        await writer.insert_data(table_name="subscribers", data=member_data)
 
         return jsonify({'status': 'success'})
     except Exception as e:
         print(f"{e} exception has raised.")
 
 
+async def prepare_database():
+    """Applies pending schema migrations and returns PRAGMA values effective for connections opened by the webhook"""
+    async with DatabaseManager() as db:
+        await db.migrate()
+        return await db.get_performance_profile()
+
+
 def exe_flask():
     """
     Run the Flask web application to listen for incoming requests.
@@ -72,4 +81,5 @@ def exe_flask():
     Returns:
         None
     """
+    print(f"Database performance profile: {asyncio.run(prepare_database())}")
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,158 @@
+"""
+Cache Module
+
+This module contains in-process caches for data which is read on almost every update. Caches are read-through:
+DatabaseManager looks a row up in the cache first, reads it from the database on a miss and stores it, and
+invalidates it whenever the row is written through DatabaseManager. Groups rows are few and written rarely, so any
+write to the groups table drops the whole group cache.
+
+The programs, admins and super_admins tables are small and change only on admin actions, so they are kept in memory
+as a whole by the program and role catalogues instead, which are reloaded after every write to their tables. Admins
+and super admins are also edited outside the bot, e.g. a revoked admin is deleted by hand, so the role catalogue is
+additionally reloaded once it is older than ROLE_CATALOGUE_TTL seconds.
+
+Classes:
+    - RowCache: TTL and LRU bounded cache of table rows keyed by their ID.
+    - ProgramCatalogue: All programs rows indexed by id and by program_name.
+    - RoleCatalogue: IDs of all admins and super admins.
+
+Attributes:
+    user_cache (RowCache): The process-wide cache of all_users rows keyed by telegram_id.
+    group_cache (RowCache): The process-wide cache of groups rows keyed by group_id.
+    program_catalogue (ProgramCatalogue): The process-wide program catalogue, loaded at startup.
+    role_catalogue (RoleCatalogue): The process-wide role catalogue, loaded at startup.
+"""
+
+
+import time
+
+from cachetools import TTLCache
+
+from database.settings import USER_CACHE_SIZE, USER_CACHE_TTL, GROUP_CACHE_SIZE, ROLE_CATALOGUE_TTL
+
+
+ROLE_TABLES = ("admins", "super_admins")
+
+
+class RowCache:
+    """
+    A cache of table rows keyed by their ID, e.g. all_users rows keyed by telegram_id.
+
+    Rows expire after `ttl` seconds, and the least recently used rows are evicted once `maxsize` rows are cached.
+    Copies of cached records are returned, so callers may modify them without affecting the cache.
+
+    Args:
+        maxsize (int): Maximum amount of cached rows.
+        ttl (int): Seconds a row is served from the cache.
+    """
+    def __init__(self, maxsize: int, ttl: int):
+        self._rows = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int):
+        """Returns copy of the cached row or None if the row is not cached"""
+        row = self._rows.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row.copy()
+
+    def put(self, key: int, row):
+        """Stores copy of the row"""
+        self._rows[key] = row.copy()
+
+    def invalidate(self, key: int):
+        """Removes the row from the cache"""
+        self._rows.pop(key, None)
+
+    def clear(self):
+        """Removes all rows from the cache"""
+        self._rows.clear()
+
+    def get_stats(self) -> dict:
+        """Returns amount of cached rows, hits, misses and hit ratio"""
+        requests = self.hits + self.misses
+        return {"size": len(self._rows),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0}
+
+
+class ProgramCatalogue:
+    """
+    All programs rows indexed by id and by program_name.
+
+    The catalogue is loaded with DatabaseManager.load_program_catalogue and reloaded by DatabaseManager once a session
+    which has written to the programs table is committed. Cached records are shared, callers must not modify them.
+    """
+    def __init__(self):
+        self._by_id = {}
+        self._by_name = {}
+        self.is_loaded = False
+
+    def load(self, programs: list):
+        """Replaces the catalogue with the programs rows"""
+        self._by_id = {program["id"]: program for program in programs}
+        self._by_name = {program["program_name"]: program for program in programs}
+        self.is_loaded = True
+
+    def get(self, program_id: int):
+        """Returns the program with the id, or None if it does not exist"""
+        return self._by_id.get(program_id)
+
+    def get_by_name(self, program_name: str):
+        """Returns the program with the name, or None if it does not exist"""
+        return self._by_name.get(program_name)
+
+    def get_all(self) -> list:
+        """Returns all programs ordered by id"""
+        return list(self._by_id.values())
+
+
+class RoleCatalogue:
+    """
+    IDs of all admins and super admins.
+
+    The catalogue is loaded with DatabaseManager.load_role_catalogue and reloaded by DatabaseManager once a session
+    which has written to the admins or super_admins table is committed. Changes made outside the bot are picked up
+    once the catalogue is stale, see is_stale.
+
+    Args:
+        ttl (int): Seconds after which the catalogue is stale and has to be reloaded.
+    """
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.admin_ids = frozenset()
+        self.super_admin_ids = frozenset()
+        self.is_loaded = False
+        self.loaded_at = None
+
+    def load(self, admin_ids: list, super_admin_ids: list):
+        """Replaces the catalogue with the IDs"""
+        self.admin_ids = frozenset(admin_ids)
+        self.super_admin_ids = frozenset(super_admin_ids)
+        self.is_loaded = True
+        self.loaded_at = time.monotonic()
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the catalogue is not loaded yet or was loaded more than ttl seconds ago"""
+        return not self.is_loaded or time.monotonic() - self.loaded_at >= self.ttl
+
+    def is_admin(self, telegram_id: int) -> bool:
+        return telegram_id in self.admin_ids
+
+    def is_super_admin(self, telegram_id: int) -> bool:
+        return telegram_id in self.super_admin_ids
+
+
+user_cache = RowCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+group_cache = RowCache(maxsize=GROUP_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+program_catalogue = ProgramCatalogue()
+
+role_catalogue = RoleCatalogue(ttl=ROLE_CATALOGUE_TTL)
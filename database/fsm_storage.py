@@ -0,0 +1,173 @@
+"""
+FSM Storage Module
+
+This module contains an aiogram FSM storage keeping the states and data of conversations in the fsm_contexts table,
+so users who are in the middle of a flow, e.g. submitting a practice, continue where they stopped after a restart.
+
+Contexts in use are kept in memory. Reads are served from memory and writes only change the in-memory context, which
+is written to the database together with the other changed contexts every FSM_FLUSH_INTERVAL seconds, so a handler
+setting a state and updating data does not wait for the disk. Contexts unused for FSM_CACHE_TTL seconds, and the least
+recently used ones above FSM_CACHE_SIZE contexts, are dropped from memory once they are written.
+
+Changes made within the last flush interval before a crash are lost, a regular shutdown writes them with close().
+
+Classes:
+    - SQLiteStorage: aiogram storage backed by the fsm_contexts table with in-memory write-behind.
+
+Example:
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+
+    # Write pending changes on shutdown
+    await storage.close()
+"""
+
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from database.main import DatabaseManager
+from database.settings import FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_FLUSH_INTERVAL
+from database.writer import writer
+
+
+class CachedContext:
+    """
+    An FSM context kept in memory.
+
+    Args:
+        state (str | None): The current state.
+        data (dict): The current data.
+    """
+    __slots__ = ("state", "data", "version", "saved_version", "used_at")
+
+    def __init__(self, state: str = None, data: dict = None):
+        self.state = state
+        self.data = data or {}
+        self.version = 0
+        self.saved_version = 0
+        self.used_at = time.monotonic()
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether the context has changes which are not written to the database yet"""
+        return self.version != self.saved_version
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    aiogram storage backed by the fsm_contexts table with in-memory write-behind.
+
+    Args:
+        cache_size (int, optional): Maximum amount of contexts kept in memory.
+        cache_ttl (int, optional): Seconds after which an unused context is dropped from memory.
+        flush_interval (float, optional): Seconds between writes of changed contexts.
+    """
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, cache_ttl: int = FSM_CACHE_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._contexts = OrderedDict()
+        self._task = None
+
+    @staticmethod
+    def _build_key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _get_context(self, key: StorageKey) -> CachedContext:
+        """Returns the context from memory, reading it from the database on a miss"""
+        storage_key = self._build_key(key)
+        context = self._contexts.get(storage_key)
+        if context is None:
+            async with DatabaseManager() as db:
+                row = await db.get_fsm_context(key=storage_key)
+
+            # Another coroutine may have loaded or changed the context meanwhile, its copy is kept
+            context = self._contexts.get(storage_key)
+            if context is None:
+                context = CachedContext(state=row["state"] if row else None,
+                                        data=json.loads(row["data"]) if row else None)
+                self._contexts[storage_key] = context
+
+        self._contexts.move_to_end(storage_key)
+        context.used_at = time.monotonic()
+        return context
+
+    def _changed(self, context: CachedContext):
+        """Marks the context as changed and makes sure the flush task is running"""
+        context.version += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        context = await self._get_context(key)
+        context.state = state.state if isinstance(state, State) else state
+        self._changed(context)
+
+    async def get_state(self, key: StorageKey):
+        return (await self._get_context(key)).state
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        context = await self._get_context(key)
+        context.data = data.copy()
+        self._changed(context)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return (await self._get_context(key)).data.copy()
+
+    async def flush(self):
+        """Writes every changed context to the database in one transaction"""
+        changed = [(storage_key, context, context.version) for storage_key, context in self._contexts.items()
+                   if context.is_dirty]
+        if not changed:
+            return
+
+        # Values which are not JSON types, e.g. dates, are stored as strings
+        contexts = [(storage_key, context.state, json.dumps(context.data, default=str))
+                    for storage_key, context, _ in changed]
+        try:
+            await writer.submit("save_fsm_contexts", contexts=contexts)
+        except Exception as e:
+            logging.error(msg=f"An error occurred during writing {len(contexts)} FSM contexts: {e}")
+            return
+
+        # Contexts changed again during the write stay dirty for the next flush
+        for _, context, version in changed:
+            context.saved_version = version
+
+    def _evict(self):
+        """Drops written contexts which are unused for cache_ttl seconds or above cache_size, least recent first"""
+        now = time.monotonic()
+        for storage_key in list(self._contexts):
+            context = self._contexts[storage_key]
+            if len(self._contexts) <= self.cache_size and now - context.used_at < self.cache_ttl:
+                break
+
+            if not context.is_dirty:
+                del self._contexts[storage_key]
+
+    async def _run(self):
+        """Flushes changed contexts every flush_interval seconds until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            self._evict()
+
+    async def close(self) -> None:
+        """Stops the flush task and writes pending changes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
@@ -2,20 +2,41 @@
 Database Module
 
 This module provides a database manager class for interacting with an SQLite database. It includes methods for
-connecting to the database, creating tables, inserting data, updating data, and performing various database
+connecting to the database, migrating the schema, inserting data, updating data, and performing various database
 operations. The module is designed to support context management for handling database connections and transactions.
+Rows are returned as compact record objects from database.records, which can be read like dicts. all_users rows
+looked up by telegram_id are served from the in-process user cache and invalidated on every write made through
+DatabaseManager. Programs and admin roles are served from the in-process program and role catalogues, which are
+reloaded once a session writing to their tables is committed.
+
+Connections are taken from the process-wide pool in database.pool when it is configured, otherwise a connection is
+opened for the duration of the session.
+
+Every statement is timed and recorded in database.stats.query_stats grouped by its normalized shape. Statements slower
+than the SLOW_QUERY_THRESHOLD setting are logged together with their EXPLAIN QUERY PLAN output.
 
 Classes:
     - DatabaseManager: A class for managing database interactions.
 
 Example:
     # Initialize a DatabaseManager
-    async with DatabaseManager("test.db") as db:
+    async with DatabaseManager() as db:
         # Perform database operations here
 """
 
 
-import aiosqlite
+import json
+import logging
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+from database.cache import user_cache, group_cache, program_catalogue, role_catalogue, ROLE_TABLES
+from database.migrations import apply_migrations
+from database.pool import pool, open_connection
+from database.records import UserContext, RowOutcome, record_factory
+from database.settings import DB_NAME, SQLITE_PROFILE, STREAM_BATCH_SIZE
+from database.stats import query_stats, normalize_query
 
 
 class DatabaseManager:
@@ -26,102 +47,192 @@ class DatabaseManager:
     for handling database connections and transactions.
 
     Args:
-        db_name (str): The name of the SQLite database.
+        db_name (str, optional): The name of the SQLite database. Defaults to the pooled database or DB_NAME setting.
 
     Example:
         # Initialize a DatabaseManager
-        async with DatabaseManager("test.db") as db:
+        async with DatabaseManager() as db:
             # Perform database operations here
     """
-    def __init__(self, db_name):
+    def __init__(self, db_name: str = None):
         self.db_name = db_name
+        self.pooled = False
+        self.savepoints = 0
+        self.invalidated_users = set()
+        self.users_cleared = False
+        self.changed_catalogues = set()
+        self.groups_changed = False
 
     async def __aenter__(self):
-        self.conn = await aiosqlite.connect(self.db_name)
-        await self.conn.execute("PRAGMA foreign_keys = ON")
+        if pool.is_configured and self.db_name in (None, pool.db_name):
+            self.conn = await pool.acquire()
+            self.pooled = True
+        else:
+            self.conn = await open_connection(self.db_name or DB_NAME)
+
         self.cursor = await self.conn.cursor()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.conn.commit()
-        await self.conn.close()
-
-    async def create_tables(self):
-        """Creates subscribers table"""
-        await self.cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS subscribers (
-                email TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                program_title TEXT
-                                                    )
-                            """)
-
-        await self.cursor.execute(f"""
-                    CREATE TABLE IF NOT EXISTS all_users (
-                        email TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        telegram_id INTEGER,
-                        telegram_username INTEGER,
-                        main_group_id INTEGER,
-                        small_group_id INTEGER,
-                        privacy TEXT,
-                        last_homework DATE,
-                        last_practice DATE,
-                        ghl_id TEXT,
-                        ghl_opp_id TEXT,
-                        first_date DATE,
-                        user_program INTEGER,
-                        FOREIGN KEY(user_program) REFERENCES programs(id) ON DELETE CASCADE
-                                                            )
-                                    """)
-
-        await self.cursor.execute(f"""
-                           CREATE TABLE IF NOT EXISTS admins (
-                               first_name TEXT,
-                               last_name TEXT,
-                               telegram_id INTEGER
-                                                                   )
-                                           """)
-
-        await self.cursor.execute(f"""CREATE TABLE IF NOT EXISTS programs (
-                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                    program_name TEXT,
-                                    program_end DATE,
-                                    ghl_pipeline_id TEXT,
-                                    ghl_students_id TEXT,
-                                    ghl_no_pop_id TEXT
-                                );
-                            """)
-
-        await self.cursor.execute(f"""
-                                   CREATE TABLE IF NOT EXISTS super_admins (
-                                       first_name TEXT,
-                                       last_name TEXT,
-                                       telegram_id INTEGER
-                                                                           )
-                                                   """)
-
-        await self.cursor.execute(f"""
-                                   CREATE TABLE IF NOT EXISTS pending_admins (
-                                       first_name TEXT,
-                                       last_name TEXT,
-                                       telegram_id INTEGER
-                                                                           )
-                                                   """)
-
-        await self.cursor.execute(f"""
-                                   CREATE TABLE IF NOT EXISTS groups (
-                                        group_title TEXT,
-                                        group_id INTEGER,
-                                        group_spreadsheet_id TEXT, 
-                                        group_invite_link TEXT,
-                                        current_members INTEGER,
-                                        program INTEGER,
-                                        FOREIGN KEY(program) REFERENCES programs(id) ON DELETE CASCADE
-                                                                     )
-                                   """)
+        try:
+            try:
+                await self.conn.commit()
+                if self.changed_catalogues:
+                    await self._reload_catalogues()
+            finally:
+                await self.cursor.close()
+        finally:
+            # Invalidate again once the writes are visible, a concurrent session may have cached the old row meanwhile
+            if self.users_cleared:
+                user_cache.clear()
+            for telegram_id in self.invalidated_users:
+                user_cache.invalidate(telegram_id)
+            if self.groups_changed:
+                group_cache.clear()
+
+            if self.pooled:
+                await pool.release(self.conn)
+            else:
+                await self.conn.close()
+
+    def _invalidate_user(self, table_name: str, telegram_id: int = None):
+        """Removes written all_users row from the user cache, or the whole cache if telegram_id is unknown"""
+        if table_name != "all_users":
+            return
+
+        if telegram_id is None:
+            self.users_cleared = True
+            user_cache.clear()
+        else:
+            self.invalidated_users.add(telegram_id)
+            user_cache.invalidate(telegram_id)
+
+    def _invalidate_catalogues(self, table_name: str):
+        """Marks the catalogue built from the written table for reload when the session is committed, and drops the
+        group cache if the groups table is written"""
+        if table_name == "groups":
+            self.groups_changed = True
+            group_cache.clear()
+        elif table_name == "programs":
+            self.changed_catalogues.add("programs")
+        elif table_name in ROLE_TABLES:
+            self.changed_catalogues.add("roles")
+
+    async def _reload_catalogues(self):
+        """Reloads catalogues whose tables were written in the session"""
+        try:
+            if "programs" in self.changed_catalogues:
+                await self.load_program_catalogue()
+            if "roles" in self.changed_catalogues:
+                await self.load_role_catalogue()
+        except Exception as e:
+            logging.error(msg=f"An error occurred during catalogue reload: {e}")
+
+    async def load_program_catalogue(self):
+        """Loads all programs into the program catalogue and returns the catalogue"""
+        result = await self._query("SELECT * FROM programs ORDER BY id", fetch="all")
+
+        make_record = self._get_record_factory()
+        program_catalogue.load([make_record(row) for row in result])
+        return program_catalogue
+
+    async def load_role_catalogue(self):
+        """Loads IDs of admins and super admins into the role catalogue and returns the catalogue"""
+        admins = await self._query("SELECT telegram_id FROM admins", fetch="all")
+        super_admins = await self._query("SELECT telegram_id FROM super_admins", fetch="all")
+
+        role_catalogue.load(admin_ids=[row[0] for row in admins], super_admin_ids=[row[0] for row in super_admins])
+        return role_catalogue
+
+    async def _get_cached_user(self, telegram_id: int):
+        """Returns all_users row from the user cache, reading and caching it on a miss"""
+        user = user_cache.get(telegram_id)
+        if user is not None:
+            return user
+
+        result = await self._query("SELECT * FROM all_users WHERE telegram_id = ?", (telegram_id,), fetch="one")
+        if not result:
+            return False
+
+        user = self._get_record_factory()(result)
+        user_cache.put(telegram_id, user)
+        return user
+
+    async def _get_cached_group(self, group_id: int):
+        """Returns groups row from the group cache, reading and caching it on a miss. Returns None if the group is not
+        registered"""
+        group = group_cache.get(group_id)
+        if group is not None:
+            return group
+
+        result = await self._query("SELECT * FROM groups WHERE group_id = ?", (group_id,), fetch="one")
+        if not result:
+            return None
+
+        group = self._get_record_factory()(result)
+        group_cache.put(group_id, group)
+        return group
+
+    async def _query(self, query: str, parameters=(), fetch: str = None):
+        """
+        Executes statement on the session cursor and records its timing in query_stats.
+
+        Args:
+            query (str): SQL statement.
+            parameters (tuple, optional): Statement parameters.
+            fetch (str, optional): "one" to return the first row, "all" to return all rows, None to fetch nothing.
+
+        Returns:
+            tuple | list | None: Fetched row or rows.
+        """
+        started = time.perf_counter()
+        await self.cursor.execute(query, parameters)
+        if fetch == "one":
+            result = await self.cursor.fetchone()
+            rows = 1 if result else 0
+        elif fetch == "all":
+            result = await self.cursor.fetchall()
+            rows = len(result)
+        else:
+            result = None
+            rows = max(self.cursor.rowcount, 0)
+
+        await self._record_query(query=query, parameters=parameters, elapsed=time.perf_counter() - started, rows=rows)
+        return result
+
+    async def _record_query(self, query: str, parameters, elapsed: float, rows: int):
+        """Records statement timing and writes the statement to the slow-query log if it exceeded the threshold"""
+        if query_stats.record(query=query, elapsed=elapsed, rows=rows):
+            plan = await self._explain(query=query, parameters=parameters)
+            logging.warning(msg=f"Slow query took {elapsed:.3f}s for {rows} rows: {normalize_query(query)}\n"
+                                f"Query plan:\n{plan}")
+
+    async def _explain(self, query: str, parameters=()) -> str:
+        """Returns EXPLAIN QUERY PLAN output of the statement, one plan step per line"""
+        try:
+            async with self.conn.execute(f"EXPLAIN QUERY PLAN {query}", parameters) as cursor:
+                plan = await cursor.fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            return f"not available: {e}"
+
+        return "\n".join(row[-1] for row in plan) or "empty"
+
+    def _get_record_factory(self):
+        """Returns cached record factory matching columns of the last executed query"""
+        return record_factory(tuple(description[0] for description in self.cursor.description))
+
+    async def get_performance_profile(self) -> dict:
+        """Returns PRAGMA values which are effective for the current connection"""
+        profile = {}
+        for pragma in SQLITE_PROFILE:
+            result = await self._query(f"PRAGMA {pragma}", fetch="one")
+            profile[pragma] = result[0]
+
+        return profile
+
+    async def migrate(self) -> list:
+        """Creates tables and indexes by applying pending schema migrations, returns applied versions"""
+        return await apply_migrations(self.conn)
 
     async def insert_data(self, table_name: str, data: dict):
         """Receives table name and data need to be inserted"""
@@ -129,10 +240,13 @@ class DatabaseManager:
         columns = ', '.join(data.keys())
         values = tuple(list(data.values()))
 
-        await self.cursor.execute(f"""
-                                          INSERT INTO {table_name} ({columns})
-                                          VALUES ({placeholders})
-                                       """, values)
+        await self._query(f"""
+                                 INSERT INTO {table_name} ({columns})
+                                 VALUES ({placeholders})
+                              """, values)
+
+        self._invalidate_user(table_name, data.get("telegram_id"))
+        self._invalidate_catalogues(table_name)
 
         last_row_id = self.cursor.lastrowid
         return last_row_id
@@ -147,7 +261,115 @@ class DatabaseManager:
                 WHERE telegram_id = ?
             """
 
-        await self.cursor.execute(query, values)
+        await self._query(query, values)
+        self._invalidate_user(table_name, telegram_id)
+        self._invalidate_catalogues(table_name)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Runs enclosed statements in one explicit transaction which is committed on exit and rolled back on error.
+
+        When a transaction is already open in the session a savepoint is used instead, so only the enclosed
+        statements are rolled back on error.
+        """
+        if self.conn.in_transaction:
+            savepoint = f"savepoint_{self.savepoints}"
+            self.savepoints += 1
+            await self.conn.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield self
+            except BaseException:
+                await self.conn.execute(f"ROLLBACK TO {savepoint}")
+                await self.conn.execute(f"RELEASE {savepoint}")
+                raise
+            else:
+                await self.conn.execute(f"RELEASE {savepoint}")
+
+        else:
+            # Timed as a statement, waiting for the write lock held by another process shows up in query_stats
+            await self._query("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            else:
+                await self.conn.commit()
+
+    async def bulk_insert(self, table_name: str, rows: list) -> list:
+        """Receives table name and list of dicts with the same keys, inserts them in one transaction and returns
+        list of RowOutcome"""
+        if not rows:
+            return []
+
+        columns = list(rows[0].keys())
+        placeholders = ', '.join(['?'] * len(columns))
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        parameters = [tuple(row[column] for column in columns) for row in rows]
+
+        for row in rows:
+            self._invalidate_user(table_name, row.get("telegram_id"))
+        self._invalidate_catalogues(table_name)
+
+        return await self._execute_bulk(query=query, parameters=parameters)
+
+    async def bulk_update(self, table_name: str, rows: list, key: str = "telegram_id") -> list:
+        """Receives table name and list of dicts with the same keys, updates rows matched by key column in one
+        transaction and returns list of RowOutcome. A row whose key matches no existing row is reported as not
+        written"""
+        if not rows:
+            return []
+
+        columns = [column for column in rows[0].keys() if column != key]
+        set_values = ', '.join([f'{column} = ?' for column in columns])
+        query = f"UPDATE {table_name} SET {set_values} WHERE {key} = ?"
+        parameters = [tuple(row[column] for column in columns) + (row[key],) for row in rows]
+
+        for row in rows:
+            self._invalidate_user(table_name, row[key] if key == "telegram_id" else None)
+        self._invalidate_catalogues(table_name)
+
+        outcomes = await self._execute_bulk(query=query, parameters=parameters)
+
+        # The key is not updated, so keys found after the update are exactly the ones the update has matched
+        result = await self._query(f"""SELECT DISTINCT {key} FROM {table_name}
+                                      WHERE {key} IN (SELECT value FROM json_each(?))""",
+                                   (json.dumps([row[key] for row in rows], default=str),), fetch="all")
+        matched = {row[0] for row in result}
+        for outcome, row in zip(outcomes, rows):
+            if outcome.ok and row[key] not in matched:
+                outcome.ok = False
+                outcome.error = f"No row with {key} {row[key]!r}"
+
+        return outcomes
+
+    async def _execute_bulk(self, query: str, parameters: list) -> list:
+        """Runs query for all parameters with executemany. If the database rejects any row, the batch is replayed
+        row by row, each in its own savepoint, so that valid rows are still written and errors are reported per row"""
+        async with self.transaction():
+            try:
+                async with self.transaction():
+                    started = time.perf_counter()
+                    await self.cursor.executemany(query, parameters)
+                    await self._record_query(query=query, parameters=parameters[0],
+                                             elapsed=time.perf_counter() - started, rows=len(parameters))
+
+                return [RowOutcome(index=index, ok=True) for index in range(len(parameters))]
+
+            except sqlite3.Error:
+                outcomes = []
+                for index, values in enumerate(parameters):
+                    try:
+                        async with self.transaction():
+                            await self._query(query, values)
+
+                        outcomes.append(RowOutcome(index=index, ok=True))
+
+                    except sqlite3.Error as e:
+                        outcomes.append(RowOutcome(index=index, ok=False, error=str(e)))
+
+                return outcomes
 
     async def update_program_data(self, table_name: str, data: dict, group_title: str):
         set_values = ', '.join([f'{key} = ?' for key in data.keys()])
@@ -159,60 +381,487 @@ class DatabaseManager:
                 WHERE program_main_group_title = ?
             """
 
-        await self.cursor.execute(query, values)
+        await self._query(query, values)
+        self._invalidate_catalogues(table_name)
 
     async def check_existence(self, table_name: str, parameters: dict):
         """Receives table name and parameters in dict, featuring key as column name and value as value in database"""
         column = parameters["column"]
         value = parameters["value"]
+        if table_name == "all_users" and column == "telegram_id":
+            return await self._get_cached_user(value)
+
         query = f"SELECT * FROM {table_name} WHERE {column} = ?"
 
-        await self.cursor.execute(query, (value, ))
-        result = await self.cursor.fetchone()
+        result = await self._query(query, (value, ), fetch="one")
         if result:
-            columns = [description[0] for description in self.cursor.description]
-            result_dict = {columns[i]: result[i] for i in range(len(columns))}
-            return result_dict
+            return self._get_record_factory()(result)
 
         else:
             return False
 
     async def get_all_user_data(self, table_name: str, telegram_id: int):
         """Receives user ID and table name anr return all user data"""
+        if table_name == "all_users":
+            return await self._get_cached_user(telegram_id)
+
         query = f"SELECT * FROM {table_name} WHERE telegram_id = ?"
 
-        await self.cursor.execute(query, (telegram_id,))
-        result = await self.cursor.fetchone()
+        result = await self._query(query, (telegram_id,), fetch="one")
+
+        if result:
+            return self._get_record_factory()(result)
+
+        else:
+            return False
+
+    async def get_user_context(self, telegram_id: int):
+        """Receives user ID and returns user data and user main group, both served from the in-process caches, together
+        with user program taken from the program catalogue"""
+        user = await self._get_cached_user(telegram_id)
+
+        if user:
+            if not program_catalogue.is_loaded:
+                await self.load_program_catalogue()
+
+            group = await self._get_cached_group(user["main_group_id"]) if user["main_group_id"] is not None else None
+            return UserContext(user=user, program=program_catalogue.get(user["user_program"]), group=group)
+
+        else:
+            return False
 
+    async def plan_notifications(self, current_day: str, due_at: str, next_due_at: str, timezone: str = None,
+                                 shard: int = 0, shards: int = 1) -> list:
+        """
+        Plans reminders of the current day for users whose practice deadline has expired and who have not submitted
+        a practice for the day, and returns the reminders which are planned but not sent yet.
+
+        Expired practice deadlines of the time zone are taken from the deadlines index and moved to next_due_at, so
+        only due users are read instead of all users. Every overdue one of them gets a notification_journal entry
+        for the day with the current and the advanced value of last_practice. last_practice holds either the date of
+        the last submitted practice or the amount of days the user has missed in a row: a counter is increased by
+        one, any other value than current_day becomes 1. The counter itself is written by finish_notification once
+        the reminder is delivered or has failed.
+
+        Planning is idempotent, users who already have an entry for the day keep it, so a sweep interrupted by a
+        restart resumes with the reminders which were not finished. Planned reminders of users who have submitted a
+        practice meanwhile are skipped.
+
+        Users who have missed three or more days also get a small group alert. Its state is kept in the group_alert
+        column apart from the reminder, since the alerts are sent as group digests after the reminders, see
+        finish_group_alert. Entries whose reminder is finished but whose alert is still pending are returned as well.
+
+        Users are split into shards by telegram_id modulo the amount of shards, so shards of one sweep can be planned
+        and sent by separate workers. Only users of the given shard are planned and returned.
+
+        Args:
+            current_day (str): ISO date the sweep runs for.
+            due_at (str): ISO UTC timestamp, deadlines up to it are expired.
+            next_due_at (str): ISO UTC timestamp of the next sweep, the new deadline of the expired ones.
+            timezone (str, optional): Only users whose own or program time zone is this one are swept. Defaults to
+                users without a time zone.
+            shard (int, optional): Shard of the users to sweep, from 0 to shards - 1.
+            shards (int, optional): Amount of shards the users are split into. Defaults to one shard of all users.
+
+        Returns:
+            list: Records with telegram_id, first_name, small_group_id, ghl_opp_id, missed_days (the advanced
+                counter), ghl_pipeline_id and ghl_no_pop_id of the user's program, status of the reminder and
+                group_alert.
+        """
+        parameters = {"current_day": current_day, "due_at": due_at, "next_due_at": next_due_at, "timezone": timezone,
+                      "shard": shard, "shards": shards}
+
+        async with self.transaction():
+            await self._query("""INSERT OR IGNORE INTO notification_journal
+                                     (sweep_date, telegram_id, timezone, status, previous_practice, new_practice,
+                                      group_alert, updated_at)
+                                 SELECT :current_day, u.telegram_id, :timezone, 'planned', u.last_practice,
+                                        CASE WHEN typeof(u.last_practice) = 'integer' AND u.last_practice >= 1
+                                             THEN u.last_practice + 1 ELSE 1 END,
+                                        CASE WHEN typeof(u.last_practice) = 'integer' AND u.last_practice >= 2
+                                             THEN 'pending' END,
+                                        datetime('now')
+                                 FROM deadlines AS d
+                                 JOIN all_users AS u ON u.telegram_id = d.telegram_id
+                                 LEFT JOIN programs AS p ON p.id = u.user_program
+                                 WHERE d.kind = 'practice' AND d.due_at <= :due_at
+                                 AND d.telegram_id % :shards = :shard
+                                 AND COALESCE(u.timezone, p.timezone) IS :timezone
+                                 AND (u.last_practice IS NULL
+                                      OR u.last_practice < :current_day OR u.last_practice > :current_day)""",
+                              parameters)
+
+            await self._query("""UPDATE deadlines
+                                 SET due_at = :next_due_at
+                                 WHERE kind = 'practice' AND due_at <= :due_at
+                                 AND telegram_id % :shards = :shard
+                                 AND EXISTS (SELECT 1 FROM all_users AS u
+                                             LEFT JOIN programs AS p ON p.id = u.user_program
+                                             WHERE u.telegram_id = deadlines.telegram_id
+                                             AND COALESCE(u.timezone, p.timezone) IS :timezone)""", parameters)
+
+            # Deadlines of deleted users are dropped once they expire
+            await self._query("""DELETE FROM deadlines
+                                 WHERE kind = 'practice' AND due_at <= :due_at
+                                 AND telegram_id % :shards = :shard
+                                 AND NOT EXISTS (SELECT 1 FROM all_users AS u
+                                                 WHERE u.telegram_id = deadlines.telegram_id)""", parameters)
+
+            await self._query("""UPDATE notification_journal
+                                 SET status = 'skipped', group_alert = NULL, updated_at = datetime('now')
+                                 WHERE sweep_date = :current_day AND status = 'planned' AND timezone IS :timezone
+                                 AND telegram_id % :shards = :shard
+                                 AND NOT EXISTS (SELECT 1 FROM all_users AS u
+                                                 WHERE u.telegram_id = notification_journal.telegram_id
+                                                 AND u.last_practice IS notification_journal.previous_practice)""",
+                              parameters)
+
+            result = await self._query("""SELECT j.telegram_id, u.first_name, u.small_group_id, u.ghl_opp_id,
+                                                 j.new_practice AS missed_days, p.ghl_pipeline_id, p.ghl_no_pop_id,
+                                                 j.status, j.group_alert
+                                          FROM notification_journal AS j
+                                          JOIN all_users AS u ON u.telegram_id = j.telegram_id
+                                          LEFT JOIN programs AS p ON p.id = u.user_program
+                                          WHERE j.sweep_date = :current_day
+                                          AND (j.status = 'planned' OR j.group_alert = 'pending')
+                                          AND j.timezone IS :timezone
+                                          AND j.telegram_id % :shards = :shard""",
+                                       parameters, fetch="all")
+
+        make_record = self._get_record_factory()
+        return [make_record(row) for row in result]
+
+    async def set_deadline(self, telegram_id: int, kind: str, due_at: str):
+        """Receives user ID, deadline kind (e.g. "practice") and ISO UTC timestamp, inserts or moves the deadline"""
+        await self._query("""INSERT INTO deadlines (telegram_id, kind, due_at) VALUES (?, ?, ?)
+                             ON CONFLICT (telegram_id, kind) DO UPDATE SET due_at = excluded.due_at""",
+                          (telegram_id, kind, due_at))
+
+    async def finish_notification(self, sweep_date: str, telegram_id: int, status: str) -> bool:
+        """
+        Marks a planned reminder as sent or failed and writes the advanced last_practice counter of the user.
+
+        Both happen in one transaction and only for a reminder which is still planned, so the counter is never
+        advanced twice. The counter is not written if the user has submitted a practice since the reminder was
+        planned.
+
+        Args:
+            sweep_date (str): ISO date of the sweep.
+            telegram_id (int): User the reminder was sent to.
+            status (str): "sent" or "failed".
+
+        Returns:
+            bool: Whether the reminder was still planned.
+        """
+        parameters = {"sweep_date": sweep_date, "telegram_id": telegram_id, "status": status}
+
+        async with self.transaction():
+            await self._query("""UPDATE notification_journal
+                                 SET status = :status, updated_at = datetime('now')
+                                 WHERE sweep_date = :sweep_date AND telegram_id = :telegram_id
+                                 AND status = 'planned'""", parameters)
+            if self.cursor.rowcount != 1:
+                return False
+
+            await self._query("""UPDATE all_users
+                                 SET last_practice = (SELECT new_practice FROM notification_journal
+                                                      WHERE sweep_date = :sweep_date AND telegram_id = :telegram_id)
+                                 WHERE telegram_id = :telegram_id
+                                 AND last_practice IS (SELECT previous_practice FROM notification_journal
+                                                       WHERE sweep_date = :sweep_date
+                                                       AND telegram_id = :telegram_id)""", parameters)
+
+        self._invalidate_user("all_users", telegram_id)
+        return True
+
+    async def finish_group_alert(self, sweep_date: str, telegram_id: int, status: str):
+        """Marks the pending small group alert of a reminder as sent or failed (status), so a resumed sweep does not
+        send it again"""
+        await self._query("""UPDATE notification_journal
+                             SET group_alert = ?, updated_at = datetime('now')
+                             WHERE sweep_date = ? AND telegram_id = ? AND group_alert = 'pending'""",
+                          (status, sweep_date, telegram_id))
+
+    async def get_notification_timezones(self) -> list:
+        """Returns distinct time zones of users, taken from the program for users without one. None stands for users
+        without a time zone"""
+        result = await self._query("""SELECT DISTINCT COALESCE(u.timezone, p.timezone)
+                                      FROM all_users AS u
+                                      LEFT JOIN programs AS p ON p.id = u.user_program""", fetch="all")
+
+        return [row[0] for row in result]
+
+    async def get_job_run(self, job_name: str):
+        """Returns the scheduler_runs row of the job's last run, or False if the job has never run"""
+        result = await self._query("SELECT * FROM scheduler_runs WHERE job_name = ?", (job_name,), fetch="one")
         if result:
-            columns = [description[0] for description in self.cursor.description]
-            result_dict = {columns[i]: result[i] for i in range(len(columns))}
-            return result_dict
+            return self._get_record_factory()(result)
 
         else:
             return False
 
+    async def save_job_run(self, job_name: str, data: dict):
+        """Receives job name and scheduler_runs columns, inserts or updates the job's run"""
+        columns = ["job_name"] + list(data.keys())
+        placeholders = ', '.join(['?'] * len(columns))
+        set_values = ', '.join([f'{key} = excluded.{key}' for key in data.keys()])
+
+        await self._query(f"""INSERT INTO scheduler_runs ({', '.join(columns)}) VALUES ({placeholders})
+                              ON CONFLICT (job_name) DO UPDATE SET {set_values}""",
+                          (job_name, *data.values()))
+
+    async def claim_lease(self, name: str, shard: int, owner: str, expires_at: str, now: str) -> bool:
+        """
+        Claims a shard of a job for the owner until expires_at. The shard is claimed if it has no lease yet, if its
+        lease has expired or if the owner already holds it, and is not claimed once it is done.
+
+        Args:
+            name (str): Name of the job run, e.g. the sweep of a day.
+            shard (int): Shard of the job.
+            owner (str): Worker claiming the shard.
+            expires_at (str): ISO UTC timestamp until which the lease is held.
+            now (str): ISO UTC timestamp, leases expiring up to it have expired.
+
+        Returns:
+            bool: Whether the owner holds the lease.
+        """
+        await self._query("""INSERT INTO leases (name, shard, owner, expires_at, status)
+                             VALUES (:name, :shard, :owner, :expires_at, 'running')
+                             ON CONFLICT (name, shard) DO UPDATE
+                             SET owner = excluded.owner, expires_at = excluded.expires_at
+                             WHERE status = 'running' AND (expires_at <= :now OR owner = excluded.owner)""",
+                          {"name": name, "shard": shard, "owner": owner, "expires_at": expires_at, "now": now})
+
+        return self.cursor.rowcount == 1
+
+    async def renew_lease(self, name: str, shard: int, owner: str, expires_at: str) -> bool:
+        """Extends the owner's running lease of the shard to expires_at, returns False if the lease was taken over"""
+        await self._query("""UPDATE leases SET expires_at = ?
+                             WHERE name = ? AND shard = ? AND owner = ? AND status = 'running'""",
+                          (expires_at, name, shard, owner))
+
+        return self.cursor.rowcount == 1
+
+    async def finish_lease(self, name: str, shard: int, owner: str):
+        """Marks the owner's lease of the shard as done, so the shard is not claimed again"""
+        await self._query("UPDATE leases SET status = 'done' WHERE name = ? AND shard = ? AND owner = ?",
+                          (name, shard, owner))
+
+    async def fail_lease(self, name: str, shard: int, owner: str):
+        """Marks the owner's lease of the shard as failed, so the shard is given up and not claimed again"""
+        await self._query("UPDATE leases SET status = 'failed' WHERE name = ? AND shard = ? AND owner = ?",
+                          (name, shard, owner))
+
+    async def take_rate_tokens(self, name: str, rate: float, capacity: float, amount: int, now: float) -> tuple:
+        """
+        Refills the shared token bucket and takes up to amount of its whole tokens in one transaction. The bucket is
+        created full on first use.
+
+        Args:
+            name (str): Name of the bucket.
+            rate (float): Tokens added per second.
+            capacity (float): Maximum amount of tokens.
+            amount (int): Amount of tokens wanted.
+            now (float): Unix timestamp of the refill.
+
+        Returns:
+            tuple: Amount of tokens taken and amount of tokens left in the bucket.
+        """
+        parameters = {"name": name, "rate": rate, "capacity": capacity, "now": now}
+        async with self.transaction():
+            await self._query("""INSERT INTO rate_limits (name, tokens, updated_at) VALUES (:name, :capacity, :now)
+                                 ON CONFLICT (name) DO UPDATE
+                                 SET tokens = MIN(:capacity, tokens + MAX(:now - updated_at, 0) * :rate),
+                                     updated_at = MAX(updated_at, :now)""", parameters)
+            tokens = (await self._query("SELECT tokens FROM rate_limits WHERE name = ?", (name,), fetch="one"))[0]
+            taken = max(0, min(amount, int(tokens)))
+            if taken:
+                await self._query("UPDATE rate_limits SET tokens = tokens - ? WHERE name = ?", (taken, name))
+
+        return taken, tokens - taken
+
+    async def get_leases(self, name: str) -> list:
+        """Returns leases of the job run's shards"""
+        result = await self._query("SELECT * FROM leases WHERE name = ? ORDER BY shard", (name,), fetch="all")
+
+        make_record = self._get_record_factory()
+        return [make_record(row) for row in result]
+
+    async def get_fsm_context(self, key: str):
+        """Returns the fsm_contexts row of the storage key, or False if the context is empty"""
+        result = await self._query("SELECT * FROM fsm_contexts WHERE key = ?", (key,), fetch="one")
+        if result:
+            return self._get_record_factory()(result)
+
+        else:
+            return False
+
+    async def save_fsm_contexts(self, contexts: list):
+        """
+        Writes FSM contexts in one transaction. Contexts without state and data are deleted.
+
+        Args:
+            contexts (list): Tuples of storage key, state and JSON encoded data.
+        """
+        saved = [(key, state, data) for key, state, data in contexts if state is not None or data != "{}"]
+        deleted = [(key,) for key, state, data in contexts if state is None and data == "{}"]
+
+        async with self.transaction():
+            if saved:
+                await self._execute_bulk(query="""INSERT INTO fsm_contexts (key, state, data, updated_at)
+                                                  VALUES (?, ?, ?, datetime('now'))
+                                                  ON CONFLICT (key) DO UPDATE
+                                                  SET state = excluded.state, data = excluded.data,
+                                                      updated_at = excluded.updated_at""",
+                                         parameters=saved)
+            if deleted:
+                await self._execute_bulk(query="DELETE FROM fsm_contexts WHERE key = ?", parameters=deleted)
+
+    async def enqueue_jobs(self, jobs: list, run_at: str) -> list:
+        """
+        Stores background jobs as pending and returns their IDs.
+
+        Args:
+            jobs (list): Tuples of job kind and JSON encoded payload.
+            run_at (str): ISO UTC timestamp from which the jobs are due.
+
+        Returns:
+            list: IDs of the stored jobs.
+        """
+        job_ids = []
+        async with self.transaction():
+            for kind, payload in jobs:
+                await self._query("""INSERT INTO jobs (kind, payload, status, attempts, run_at, created_at, updated_at)
+                                     VALUES (?, ?, 'pending', 0, ?, datetime('now'), datetime('now'))""",
+                                  (kind, payload, run_at))
+                job_ids.append(self.cursor.lastrowid)
+
+        return job_ids
+
+    async def claim_jobs(self, now: str, lease_until: str, limit: int, running: list = ()) -> list:
+        """
+        Claims due jobs for a run and returns them. Due are pending jobs whose run_at has passed and running jobs whose
+        lease has expired, i.e. jobs of a crashed process.
+
+        Args:
+            now (str): ISO UTC timestamp of the claim.
+            lease_until (str): ISO UTC timestamp until which the claimed jobs are reserved.
+            limit (int): Maximum amount of claimed jobs.
+            running (list, optional): IDs of jobs the claiming process is running, which are never claimed again even
+                if their lease has expired.
+
+        Returns:
+            list: Records with id, kind, payload and attempts (including the claimed run) of the claimed jobs.
+        """
+        result = await self._query("""UPDATE jobs
+                                       SET status = 'running', attempts = attempts + 1, run_at = :lease_until,
+                                           updated_at = datetime('now')
+                                       WHERE id IN (SELECT id FROM jobs
+                                                    WHERE status IN ('pending', 'running') AND run_at <= :now
+                                                    AND id NOT IN (SELECT value FROM json_each(:running))
+                                                    ORDER BY run_at
+                                                    LIMIT :limit)
+                                       RETURNING id, kind, payload, attempts""",
+                                   {"now": now, "lease_until": lease_until, "limit": limit,
+                                    "running": json.dumps(list(running))}, fetch="all")
+
+        make_record = self._get_record_factory()
+        return [make_record(row) for row in result]
+
+    async def renew_jobs(self, job_ids: list, lease_until: str):
+        """Extends leases of running jobs to lease_until (ISO UTC timestamp)"""
+        await self._query("""UPDATE jobs SET run_at = ?
+                             WHERE status = 'running' AND id IN (SELECT value FROM json_each(?))""",
+                          (lease_until, json.dumps(list(job_ids))))
+
+    async def finish_job(self, job_id: int):
+        """Removes a job which has run successfully"""
+        await self._query("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    async def retry_job(self, job_id: int, run_at: str, error: str, payload: str = None, count_attempt: bool = True):
+        """Returns a failed job to pending, to be run again from run_at (ISO UTC timestamp). The payload is replaced
+        if given, e.g. by the part of the job which is left to do. Without count_attempt the run is not counted towards
+        the job's attempts"""
+        await self._query("""UPDATE jobs
+                             SET status = 'pending', attempts = attempts - ?, run_at = ?, last_error = ?,
+                                 payload = COALESCE(?, payload), updated_at = datetime('now')
+                             WHERE id = ?""", (0 if count_attempt else 1, run_at, error, payload, job_id))
+
+    async def fail_job(self, job_id: int, error: str, payload: str = None):
+        """Marks a job which has run out of attempts as failed, it is kept for inspection. The payload is replaced if
+        given"""
+        await self._query("""UPDATE jobs SET status = 'failed', last_error = ?, payload = COALESCE(?, payload),
+                                 updated_at = datetime('now')
+                             WHERE id = ?""", (error, payload, job_id))
+
+    async def release_jobs(self, job_ids: list, run_at: str):
+        """Returns claimed jobs whose run was interrupted by a shutdown to pending, without counting the attempt"""
+        await self._query(f"""UPDATE jobs SET status = 'pending', attempts = attempts - 1, run_at = ?,
+                                  updated_at = datetime('now')
+                              WHERE status = 'running' AND id IN ({', '.join(['?'] * len(job_ids))})""",
+                          (run_at, *job_ids))
+
     async def drop_table(self, table_name: str):
         query = f"DROP TABLE {table_name}"
 
-        await self.cursor.execute(query)
+        await self._query(query)
 
     async def get_all_table_data(self, table_name: str):
         query = f"SELECT * FROM {table_name}"
-        await self.cursor.execute(query)
-        result = await self.cursor.fetchall()
+        result = await self._query(query, fetch="all")
 
         if result:
-            columns = [description[0] for description in self.cursor.description]
-            result_list = [dict(zip(columns, row)) for row in result]
-            return result_list
+            make_record = self._get_record_factory()
+            return [make_record(row) for row in result]
 
         else:
             return []
 
+    async def stream_query(self, query: str, parameters: tuple = (), batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Executes query and asynchronously yields its result as lists of at most batch_size records.
+
+        Rows are fetched from the database one batch at a time, so a caller can start processing before the whole
+        result is read and memory stays bounded by the batch size. The query runs on its own cursor, so other
+        DatabaseManager methods can be used while iterating.
+        """
+        elapsed = 0.0
+        fetched = 0
+        cursor = await self.conn.cursor()
+        try:
+            started = time.perf_counter()
+            await cursor.execute(query, parameters)
+            elapsed += time.perf_counter() - started
+            if cursor.description is None:
+                return
+
+            make_record = record_factory(tuple(description[0] for description in cursor.description))
+            while True:
+                started = time.perf_counter()
+                rows = await cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - started
+                if not rows:
+                    break
+
+                fetched += len(rows)
+                yield [make_record(row) for row in rows]
+
+            # Only time spent in the database is recorded, not the time the caller spent processing batches
+            await self._record_query(query=query, parameters=parameters, elapsed=elapsed, rows=fetched)
+
+        finally:
+            await cursor.close()
+
+    async def stream_table_data(self, table_name: str, batch_size: int = STREAM_BATCH_SIZE):
+        """Asynchronously yields all rows of the table as lists of at most batch_size records"""
+        async for batch in self.stream_query(f"SELECT * FROM {table_name}", batch_size=batch_size):
+            yield batch
+
     async def delete_user_from_db(self, table_name: str, telegram_id: int):
         query = f"DELETE FROM {table_name} WHERE telegram_id = ?"
-        await self.cursor.execute(query, (telegram_id, ))
+        await self._query(query, (telegram_id, ))
+        self._invalidate_user(table_name, telegram_id)
+        self._invalidate_catalogues(table_name)
 
     async def get_program_data(self, parameters: dict):
         query = "SELECT * FROM programs"
@@ -225,20 +874,17 @@ class DatabaseManager:
 
         query += " WHERE " + " AND ".join(placeholders)
 
-        await self.cursor.execute(query, tuple(values))
-        result = await self.cursor.fetchall()
+        result = await self._query(query, tuple(values), fetch="all")
 
-        return result
+        make_record = self._get_record_factory()
+        return [make_record(row) for row in result]
 
     async def custom_query(self, query: str):
-        await self.cursor.execute(query)
-
-        result = await self.cursor.fetchall()
+        result = await self._query(query, fetch="all")
 
         if result:
-            columns = [description[0] for description in self.cursor.description]
-            result_list = [dict(zip(columns, row)) for row in result]
-            return result_list
+            make_record = self._get_record_factory()
+            return [make_record(row) for row in result]
 
         else:
             return False
@@ -246,6 +892,9 @@ class DatabaseManager:
     async def delete_program(self, program_id: int):
         query = f"""DELETE FROM programs WHERE id = {program_id}"""
 
-        await self.cursor.execute(query)
+        await self._query(query)
+        # Users of the program are deleted by ON DELETE CASCADE
+        self._invalidate_user("all_users")
+        self._invalidate_catalogues("programs")
 
     # also there is some GoHighLevel related methods that could not be disclosed due to NDA.
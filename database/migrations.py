@@ -0,0 +1,228 @@
+"""
+Schema Migrations Module
+
+This module contains versioned schema migrations for the SQLite database. Applied versions are recorded in the
+schema_migrations table, and every pending migration is applied in order at startup inside a single write
+transaction, so the bot and the webhook processes can both start against the same database safely.
+
+To change the schema append a new (version, name, statements) entry to MIGRATIONS. Never edit a migration which
+has already been released, because databases that applied it will not run it again.
+
+Functions:
+    - apply_migrations(conn): Applies pending migrations and returns the list of applied versions.
+"""
+
+
+from datetime import datetime
+import aiosqlite
+
+
+MIGRATIONS = [
+    (1, "Initial schema", [
+        """CREATE TABLE IF NOT EXISTS subscribers (
+               email TEXT,
+               first_name TEXT,
+               last_name TEXT,
+               program_title TEXT
+           )""",
+        """CREATE TABLE IF NOT EXISTS all_users (
+               email TEXT,
+               first_name TEXT,
+               last_name TEXT,
+               telegram_id INTEGER,
+               telegram_username INTEGER,
+               main_group_id INTEGER,
+               small_group_id INTEGER,
+               privacy TEXT,
+               last_homework DATE,
+               last_practice DATE,
+               ghl_id TEXT,
+               ghl_opp_id TEXT,
+               first_date DATE,
+               user_program INTEGER,
+               FOREIGN KEY(user_program) REFERENCES programs(id) ON DELETE CASCADE
+           )""",
+        """CREATE TABLE IF NOT EXISTS admins (
+               first_name TEXT,
+               last_name TEXT,
+               telegram_id INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS programs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               program_name TEXT,
+               program_end DATE,
+               ghl_pipeline_id TEXT,
+               ghl_students_id TEXT,
+               ghl_no_pop_id TEXT
+           )""",
+        """CREATE TABLE IF NOT EXISTS super_admins (
+               first_name TEXT,
+               last_name TEXT,
+               telegram_id INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS pending_admins (
+               first_name TEXT,
+               last_name TEXT,
+               telegram_id INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS groups (
+               group_title TEXT,
+               group_id INTEGER,
+               group_spreadsheet_id TEXT,
+               group_invite_link TEXT,
+               current_members INTEGER,
+               program INTEGER,
+               FOREIGN KEY(program) REFERENCES programs(id) ON DELETE CASCADE
+           )""",
+    ]),
+    (2, "Indexes on lookup columns", [
+        # Lookups by telegram_id return the first matching row, so the oldest record of a duplicated user is kept.
+        # The removed records, e.g. a newer enrollment into another program, are copied to all_users_duplicates
+        # first, so they can be reviewed and merged by hand.
+        """CREATE TABLE IF NOT EXISTS all_users_duplicates AS
+           SELECT rowid AS original_rowid, datetime('now') AS removed_at, * FROM all_users WHERE 0""",
+        """INSERT INTO all_users_duplicates
+           SELECT rowid, datetime('now'), * FROM all_users
+           WHERE telegram_id IS NOT NULL
+           AND rowid NOT IN (SELECT MIN(rowid) FROM all_users GROUP BY telegram_id)""",
+        """DELETE FROM all_users
+           WHERE telegram_id IS NOT NULL
+           AND rowid NOT IN (SELECT MIN(rowid) FROM all_users GROUP BY telegram_id)""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_all_users_telegram_id ON all_users (telegram_id)",
+        "CREATE INDEX IF NOT EXISTS ix_all_users_user_program ON all_users (user_program)",
+        "CREATE INDEX IF NOT EXISTS ix_subscribers_email ON subscribers (email)",
+        "CREATE INDEX IF NOT EXISTS ix_programs_program_name ON programs (program_name)",
+        "CREATE INDEX IF NOT EXISTS ix_groups_group_id ON groups (group_id)",
+        "CREATE INDEX IF NOT EXISTS ix_groups_program ON groups (program, current_members)",
+        "CREATE INDEX IF NOT EXISTS ix_admins_telegram_id ON admins (telegram_id)",
+        "CREATE INDEX IF NOT EXISTS ix_super_admins_telegram_id ON super_admins (telegram_id)",
+        "CREATE INDEX IF NOT EXISTS ix_pending_admins_telegram_id ON pending_admins (telegram_id)",
+    ]),
+    (3, "Scheduler runs", [
+        """CREATE TABLE IF NOT EXISTS scheduler_runs (
+               job_name TEXT PRIMARY KEY,
+               scheduled_at TEXT,
+               started_at TEXT,
+               finished_at TEXT,
+               status TEXT
+           )""",
+    ]),
+    (4, "Time zones of users and programs", [
+        # IANA time zone names, a user without a time zone gets the one of the program
+        "ALTER TABLE all_users ADD COLUMN timezone TEXT",
+        "ALTER TABLE programs ADD COLUMN timezone TEXT",
+    ]),
+    (5, "Notification journal", [
+        # previous_practice has no type affinity, so dates and day counters keep their type for comparison
+        """CREATE TABLE IF NOT EXISTS notification_journal (
+               sweep_date TEXT NOT NULL,
+               telegram_id INTEGER NOT NULL,
+               timezone TEXT,
+               status TEXT NOT NULL,
+               previous_practice,
+               new_practice INTEGER,
+               updated_at TEXT,
+               PRIMARY KEY (sweep_date, telegram_id)
+           )""",
+        "CREATE INDEX IF NOT EXISTS ix_notification_journal_status ON notification_journal (sweep_date, status)",
+    ]),
+    (6, "Deadlines", [
+        # due_at is an ISO UTC timestamp, so deadlines sort by time as text
+        """CREATE TABLE IF NOT EXISTS deadlines (
+               telegram_id INTEGER NOT NULL,
+               kind TEXT NOT NULL,
+               due_at TEXT NOT NULL,
+               PRIMARY KEY (telegram_id, kind)
+           )""",
+        "CREATE INDEX IF NOT EXISTS ix_deadlines_due_at ON deadlines (kind, due_at)",
+        # Every existing user is due for the first practice sweep, which moves the deadlines to the next day
+        """INSERT OR IGNORE INTO deadlines (telegram_id, kind, due_at)
+           SELECT telegram_id, 'practice', '1970-01-01T00:00:00+00:00' FROM all_users WHERE telegram_id IS NOT NULL""",
+    ]),
+    (7, "Leases", [
+        # A shard of a job is worked on by the owner of its lease until expires_at, an expired lease can be taken over
+        """CREATE TABLE IF NOT EXISTS leases (
+               name TEXT NOT NULL,
+               shard INTEGER NOT NULL,
+               owner TEXT NOT NULL,
+               expires_at TEXT NOT NULL,
+               status TEXT NOT NULL,
+               PRIMARY KEY (name, shard)
+           )""",
+    ]),
+    (8, "FSM contexts", [
+        # key is built from the aiogram storage key, data is the JSON encoded FSM data
+        """CREATE TABLE IF NOT EXISTS fsm_contexts (
+               key TEXT PRIMARY KEY,
+               state TEXT,
+               data TEXT NOT NULL,
+               updated_at TEXT
+           )""",
+    ]),
+    (9, "Jobs", [
+        # run_at is an ISO UTC timestamp: when a pending job is due, or when the lease of a running job expires
+        """CREATE TABLE IF NOT EXISTS jobs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               kind TEXT NOT NULL,
+               payload TEXT NOT NULL,
+               status TEXT NOT NULL,
+               attempts INTEGER NOT NULL DEFAULT 0,
+               run_at TEXT NOT NULL,
+               last_error TEXT,
+               created_at TEXT,
+               updated_at TEXT
+           )""",
+        "CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)",
+    ]),
+    (10, "Notification group alerts", [
+        # State of the small group alert of a reminder, tracked apart from the reminder itself: NULL if the reminder
+        # has no alert, 'pending' until the group digest is delivered, then 'sent' or 'failed'
+        "ALTER TABLE notification_journal ADD COLUMN group_alert TEXT",
+    ]),
+    (11, "Rate limits", [
+        # Token buckets shared by every process, updated_at is a Unix timestamp of the last refill
+        """CREATE TABLE IF NOT EXISTS rate_limits (
+               name TEXT PRIMARY KEY,
+               tokens REAL NOT NULL,
+               updated_at REAL NOT NULL
+           )""",
+    ]),
+]
+
+
+async def apply_migrations(conn: aiosqlite.Connection) -> list:
+    """Applies pending migrations in a single transaction and returns the list of applied versions"""
+    if conn.in_transaction:
+        await conn.commit()
+
+    # IMMEDIATE takes the write lock up front, so a process starting concurrently waits and then sees the new version
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        await conn.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                                  version INTEGER PRIMARY KEY,
+                                  name TEXT,
+                                  applied_at TEXT
+                              )""")
+
+        async with conn.execute("SELECT MAX(version) FROM schema_migrations") as cursor:
+            current_version = (await cursor.fetchone())[0] or 0
+
+        applied = []
+        for version, name, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            for statement in statements:
+                await conn.execute(statement)
+
+            await conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                               (version, name, datetime.now().isoformat(timespec="seconds")))
+            applied.append(version)
+
+        await conn.commit()
+
+    except Exception:
+        await conn.rollback()
+        raise
+
+    return applied
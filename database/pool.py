@@ -0,0 +1,125 @@
+"""
+Connection Pool Module
+
+This module provides a process-wide pool of long-lived aiosqlite connections. Opening an aiosqlite connection spawns
+a new thread and runs the connection PRAGMAs, so the pool keeps connections open between DatabaseManager sessions
+and hands them out again instead of reconnecting on every `async with DatabaseManager()` block.
+
+Classes:
+    - ConnectionPool: A pool of reusable connections to a single SQLite database.
+
+Attributes:
+    pool (ConnectionPool): The process-wide pool used by DatabaseManager.
+
+Example:
+    # Configure the pool once at startup
+    pool.configure(db_name="test.db", size=5)
+
+    # Close every pooled connection on shutdown
+    await pool.close()
+"""
+
+
+import asyncio
+import aiosqlite
+
+from database.settings import SQLITE_PROFILE
+
+
+PRAGMA_CHOICES = {"journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+                  "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+                  "foreign_keys": {"ON", "OFF"}}
+
+
+def get_pragma_statements(profile: dict) -> list:
+    """Validates performance profile and returns PRAGMA statements to apply it"""
+    statements = []
+    for pragma, value in profile.items():
+        if pragma in PRAGMA_CHOICES:
+            value = str(value).upper()
+            if value not in PRAGMA_CHOICES[pragma]:
+                raise ValueError(f"Unsupported value {value} for PRAGMA {pragma}")
+        else:
+            value = int(value)
+
+        statements.append(f"PRAGMA {pragma} = {value}")
+
+    return statements
+
+
+async def open_connection(db_name: str) -> aiosqlite.Connection:
+    """Opens a new connection to the database and applies the performance profile from database settings"""
+    conn = await aiosqlite.connect(db_name)
+    for statement in get_pragma_statements(SQLITE_PROFILE):
+        await conn.execute(statement)
+
+    return conn
+
+
+class ConnectionPool:
+    """
+    A pool of reusable connections to a single SQLite database.
+
+    Connections are opened lazily, up to `size` of them, and are returned to the pool when a DatabaseManager session
+    ends. When every connection is in use, `acquire` waits until one of them is released.
+
+    The pool is bound to the event loop it is first used in, so it should only be configured by long-running processes
+    such as the bots. Until `configure` is called DatabaseManager falls back to opening a connection per session.
+    """
+    def __init__(self):
+        self.db_name = None
+        self.size = 0
+        self._idle = None
+        self._connections = []
+        self._opened = 0
+
+    @property
+    def is_configured(self) -> bool:
+        return self.db_name is not None
+
+    def configure(self, db_name: str, size: int):
+        """Sets database path and maximum amount of connections. Has to be called before the first acquire"""
+        if size < 1:
+            raise ValueError(f"Connection pool size must be positive, got {size}")
+
+        self.db_name = db_name
+        self.size = size
+        self._idle = asyncio.Queue()
+
+    async def acquire(self) -> aiosqlite.Connection:
+        """Returns an idle connection, opening a new one if the pool is not full yet"""
+        if not self.is_configured:
+            raise RuntimeError("Connection pool is not configured")
+
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                conn = await open_connection(self.db_name)
+            except Exception:
+                self._opened -= 1
+                raise
+
+            self._connections.append(conn)
+            return conn
+
+        return await self._idle.get()
+
+    async def release(self, conn: aiosqlite.Connection):
+        """Returns connection to the pool, rolling back any transaction left open by the session"""
+        if conn.in_transaction:
+            await conn.rollback()
+
+        self._idle.put_nowait(conn)
+
+    async def close(self):
+        """Closes every connection opened by the pool"""
+        for conn in self._connections:
+            await conn.close()
+
+        self._connections = []
+        self._opened = 0
+        self.db_name = None
+        self._idle = None
+
+
+pool = ConnectionPool()
@@ -0,0 +1,221 @@
+"""
+Database Records Module
+
+This module contains compact typed record classes for the database tables and the structured objects returned by
+joined queries. Records keep their values in __slots__ instead of a per-row dict, and support the read-only mapping
+interface (record["telegram_id"], record.get(...), keys(), items()) used across handlers, so they can be passed
+wherever a row dict was expected.
+
+Classes:
+    - Record: Base class of all records.
+    - UserRecord, ProgramRecord, GroupRecord, AdminRecord, SubscriberRecord: Records of the corresponding tables.
+    - UserContext: A user's all_users row together with the user's program and main group rows.
+    - RowOutcome: Result of a single row of a bulk write.
+
+Functions:
+    - record_factory(columns): Returns a cached record class for the given result columns.
+
+Attributes:
+    USER_COLUMNS (tuple): Columns of the all_users table.
+    PROGRAM_COLUMNS (tuple): Columns of the programs table.
+    GROUP_COLUMNS (tuple): Columns of the groups table.
+    ADMIN_COLUMNS (tuple): Columns of the admins, super_admins and pending_admins tables.
+    SUBSCRIBER_COLUMNS (tuple): Columns of the subscribers table.
+"""
+
+
+from collections.abc import Mapping
+from functools import lru_cache
+
+
+USER_COLUMNS = ("email", "first_name", "last_name", "telegram_id", "telegram_username", "main_group_id",
+                "small_group_id", "privacy", "last_homework", "last_practice", "ghl_id", "ghl_opp_id", "first_date",
+                "user_program", "timezone")
+
+PROGRAM_COLUMNS = ("id", "program_name", "program_end", "ghl_pipeline_id", "ghl_students_id", "ghl_no_pop_id",
+                   "timezone")
+
+GROUP_COLUMNS = ("group_title", "group_id", "group_spreadsheet_id", "group_invite_link", "current_members",
+                 "program")
+
+ADMIN_COLUMNS = ("first_name", "last_name", "telegram_id")
+
+SUBSCRIBER_COLUMNS = ("email", "first_name", "last_name", "program_title")
+
+
+class Record(Mapping):
+    """
+    Base class of database records.
+
+    Subclasses define __slots__ with the column names in the order they are selected. A record can be read both as
+    attributes (user.telegram_id) and as a mapping (user["telegram_id"]).
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+
+    def __getitem__(self, column):
+        if column in self.__slots__:
+            return getattr(self, column)
+
+        raise KeyError(column)
+
+    def __setitem__(self, column, value):
+        if column not in self.__slots__:
+            raise KeyError(column)
+
+        setattr(self, column, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        values = ", ".join(f"{column}={getattr(self, column)!r}" for column in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def copy(self):
+        """Returns a shallow copy of the record"""
+        return type(self)(*self.values())
+
+
+class UserRecord(Record):
+    """A row of the all_users table"""
+    __slots__ = USER_COLUMNS
+
+    email: str
+    first_name: str
+    last_name: str
+    telegram_id: int
+    telegram_username: str
+    main_group_id: int
+    small_group_id: int
+    privacy: str
+    last_homework: str
+    last_practice: str
+    ghl_id: str
+    ghl_opp_id: str
+    first_date: str
+    user_program: int
+    timezone: str
+
+
+class ProgramRecord(Record):
+    """A row of the programs table"""
+    __slots__ = PROGRAM_COLUMNS
+
+    id: int
+    program_name: str
+    program_end: str
+    ghl_pipeline_id: str
+    ghl_students_id: str
+    ghl_no_pop_id: str
+    timezone: str
+
+
+class GroupRecord(Record):
+    """A row of the groups table"""
+    __slots__ = GROUP_COLUMNS
+
+    group_title: str
+    group_id: int
+    group_spreadsheet_id: str
+    group_invite_link: str
+    current_members: int
+    program: int
+
+
+class AdminRecord(Record):
+    """A row of the admins, super_admins or pending_admins table"""
+    __slots__ = ADMIN_COLUMNS
+
+    first_name: str
+    last_name: str
+    telegram_id: int
+
+
+class SubscriberRecord(Record):
+    """A row of the subscribers table"""
+    __slots__ = SUBSCRIBER_COLUMNS
+
+    email: str
+    first_name: str
+    last_name: str
+    program_title: str
+
+
+TABLE_RECORDS = (UserRecord, ProgramRecord, GroupRecord, AdminRecord, SubscriberRecord)
+
+
+@lru_cache(maxsize=256)
+def record_factory(columns: tuple):
+    """
+    Returns a callable which turns a result row with the given columns into a record.
+
+    Rows of whole tables get the table's record class. Other result shapes get a record class generated once per
+    shape, or a plain dict if a column name is not a valid attribute name, e.g. COUNT(*) without an alias.
+
+    Args:
+        columns (tuple): Column names taken from cursor description.
+
+    Returns:
+        callable: Function receiving a row tuple and returning a record.
+    """
+    for record_class in TABLE_RECORDS:
+        if record_class.__slots__ == columns:
+            return lambda row: record_class(*row)
+
+    if all(column.isidentifier() for column in columns) and len(set(columns)) == len(columns):
+        record_class = type("Row", (Record,), {"__slots__": columns})
+        return lambda row: record_class(*row)
+
+    return lambda row: dict(zip(columns, row))
+
+
+class UserContext:
+    """
+    A user's all_users row together with the program row and the main group row of the user.
+
+    Args:
+        user (UserRecord): The user's all_users row.
+        program (ProgramRecord | None): The user's programs row, None if the program does not exist anymore.
+        group (GroupRecord | None): The groups row of the user's main group, None if the group is not registered.
+    """
+    __slots__ = ("user", "program", "group")
+
+    def __init__(self, user: UserRecord, program: ProgramRecord = None, group: GroupRecord = None):
+        self.user = user
+        self.program = program
+        self.group = group
+
+    @property
+    def timezone(self):
+        """The user's time zone, or the time zone of the user's program if the user has none"""
+        if self.user.timezone:
+            return self.user.timezone
+
+        return self.program.timezone if self.program is not None else None
+
+
+class RowOutcome:
+    """
+    Result of a single row of a bulk write.
+
+    Args:
+        index (int): Position of the row in the sequence passed to the bulk method.
+        ok (bool): Whether the row was written. An update matching no existing row is not written.
+        error (str | None): Error message if the row was rejected by the database or matched no row.
+    """
+    __slots__ = ("index", "ok", "error")
+
+    def __init__(self, index: int, ok: bool, error: str = None):
+        self.index = index
+        self.ok = ok
+        self.error = error
+
+    def __repr__(self):
+        return f"RowOutcome(index={self.index}, ok={self.ok}, error={self.error!r})"
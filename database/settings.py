@@ -0,0 +1,53 @@
+"""
+Database Settings Module
+
+This module contains configuration for the SQLite database shared by the training bot, the welcome bot and the Flask
+webhook application. Every value can be overridden with an environment variable (a `.env` file is supported).
+
+Attributes:
+    DB_NAME (str): Path to the SQLite database file.
+    POOL_SIZE (int): Maximum amount of long-lived connections kept by the connection pool.
+    STREAM_BATCH_SIZE (int): Amount of rows fetched at once by DatabaseManager streaming reads.
+    USER_CACHE_SIZE (int): Maximum amount of all_users rows kept in the in-process user cache.
+    USER_CACHE_TTL (int): Seconds after which a cached all_users or groups row is read from the database again.
+    GROUP_CACHE_SIZE (int): Maximum amount of groups rows kept in the in-process group cache.
+    ROLE_CATALOGUE_TTL (int): Seconds after which the IDs of admins and super admins are read from the database again,
+        so admins added or removed outside the bot get or lose access without a restart.
+    WRITER_WINDOW (float): Seconds the writer task waits for more writes to commit them in one transaction.
+    WRITER_MAX_BATCH (int): Maximum amount of writes the writer task commits in one transaction.
+    SLOW_QUERY_THRESHOLD (float): Seconds after which a statement is written to the slow-query log together with its
+        query plan.
+    FSM_CACHE_SIZE (int): Maximum amount of FSM contexts kept in memory by the SQLite FSM storage.
+    FSM_CACHE_TTL (int): Seconds after which an unused FSM context is dropped from memory.
+    FSM_FLUSH_INTERVAL (float): Seconds between writes of changed FSM contexts to the database.
+    SQLITE_PROFILE (dict): PRAGMA values applied to every new connection. WAL journal lets the bot and the webhook
+        processes read while the other one writes, busy timeout (milliseconds) makes a writer wait for the lock
+        instead of failing with "database is locked", mmap size is in bytes and a negative cache size is in KiB.
+"""
+
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_NAME = os.environ.get("DATABASE_NAME", "test.db")
+POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+STREAM_BATCH_SIZE = int(os.environ.get("DATABASE_STREAM_BATCH_SIZE", 500))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 300))
+GROUP_CACHE_SIZE = int(os.environ.get("GROUP_CACHE_SIZE", 1000))
+ROLE_CATALOGUE_TTL = int(os.environ.get("ROLE_CATALOGUE_TTL", 60))
+WRITER_WINDOW = float(os.environ.get("DATABASE_WRITER_WINDOW", 0.005))
+WRITER_MAX_BATCH = int(os.environ.get("DATABASE_WRITER_MAX_BATCH", 100))
+SLOW_QUERY_THRESHOLD = float(os.environ.get("DATABASE_SLOW_QUERY_THRESHOLD", 0.1))
+FSM_CACHE_SIZE = int(os.environ.get("FSM_CACHE_SIZE", 10000))
+FSM_CACHE_TTL = int(os.environ.get("FSM_CACHE_TTL", 3600))
+FSM_FLUSH_INTERVAL = float(os.environ.get("FSM_FLUSH_INTERVAL", 1.0))
+
+SQLITE_PROFILE = {"busy_timeout": int(os.environ.get("DATABASE_BUSY_TIMEOUT", 5000)),
+                  "journal_mode": os.environ.get("DATABASE_JOURNAL_MODE", "WAL"),
+                  "synchronous": os.environ.get("DATABASE_SYNCHRONOUS", "NORMAL"),
+                  "mmap_size": int(os.environ.get("DATABASE_MMAP_SIZE", 268435456)),
+                  "cache_size": int(os.environ.get("DATABASE_CACHE_SIZE", -16000)),
+                  "foreign_keys": "ON"}
@@ -0,0 +1,122 @@
+"""
+Query Statistics Module
+
+This module collects timing statistics of the statements executed by DatabaseManager. Statements are grouped by
+their normalized shape, i.e. SQL text with literals replaced by placeholders and whitespace collapsed, so that
+f-string queries differing only in an id end up in the same group. For each shape a latency histogram, the total
+and maximum time and the amount of returned or changed rows are kept.
+
+Classes:
+    - QueryStats: Per-shape statistics of executed statements.
+
+Functions:
+    - normalize_query(query): Returns the normalized shape of a statement.
+
+Attributes:
+    query_stats (QueryStats): The process-wide statistics, exported with query_stats.snapshot().
+"""
+
+
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+from database.settings import SLOW_QUERY_THRESHOLD
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_query(query: str) -> str:
+    """Replaces literals with placeholders, collapses placeholder lists and whitespace"""
+    shape = STRING_LITERAL.sub("?", query)
+    shape = NUMBER_LITERAL.sub("?", shape)
+    shape = PLACEHOLDER_LIST.sub("(...)", shape)
+    return WHITESPACE.sub(" ", shape).strip()
+
+
+class ShapeStats:
+    """
+    Statistics of a single statement shape.
+
+    Attributes:
+        count (int): Amount of executions.
+        total_time (float): Sum of execution times in seconds.
+        max_time (float): Longest execution time in seconds.
+        rows (int): Sum of fetched or changed rows.
+        buckets (list): Amount of executions per LATENCY_BUCKETS upper bound, the last item counts slower ones.
+    """
+    __slots__ = ("count", "total_time", "max_time", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed: float, rows: int):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.rows += rows
+        self.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def as_dict(self) -> dict:
+        histogram = {str(bound): amount for bound, amount in zip(LATENCY_BUCKETS, self.buckets)}
+        histogram["+Inf"] = self.buckets[-1]
+        return {"count": self.count,
+                "total_time": self.total_time,
+                "mean_time": self.total_time / self.count if self.count else 0.0,
+                "max_time": self.max_time,
+                "rows": self.rows,
+                "histogram": histogram}
+
+
+class QueryStats:
+    """
+    Per-shape statistics of statements executed in this process.
+
+    Args:
+        slow_query_threshold (float): Seconds after which a statement is considered slow.
+    """
+    def __init__(self, slow_query_threshold: float):
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = 0
+        self._shapes = {}
+
+    def record(self, query: str, elapsed: float, rows: int) -> bool:
+        """Adds execution of the statement to its shape statistics and returns whether it was slow"""
+        shape = normalize_query(query)
+        stats = self._shapes.get(shape)
+        if stats is None:
+            stats = self._shapes[shape] = ShapeStats()
+
+        stats.add(elapsed, rows)
+
+        if elapsed >= self.slow_query_threshold:
+            self.slow_queries += 1
+            return True
+
+        return False
+
+    def snapshot(self) -> dict:
+        """Returns statistics of every shape ordered by total time, the most expensive first"""
+        shapes = sorted(self._shapes.items(), key=lambda item: item[1].total_time, reverse=True)
+        return {"slow_query_threshold": self.slow_query_threshold,
+                "slow_queries": self.slow_queries,
+                "shapes": {shape: stats.as_dict() for shape, stats in shapes}}
+
+    def reset(self):
+        """Removes collected statistics"""
+        self.slow_queries = 0
+        self._shapes = {}
+
+
+query_stats = QueryStats(slow_query_threshold=SLOW_QUERY_THRESHOLD)
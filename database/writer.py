@@ -0,0 +1,191 @@
+"""
+Database Writer Module
+
+This module contains a single-writer task for SQLite. Instead of every coroutine opening its own session and
+committing its own write, callers submit write intents to a queue. The writer task collects the intents arriving
+within a short window and applies them in one transaction, each in its own savepoint, so a failing write does not
+affect the others. Every caller's future is resolved once the transaction has committed.
+
+The writer has to be started by a long-running process. While it is not running or is stopping, writes are applied
+directly with a DatabaseManager session, which is what the Flask webhook does since it runs every request in its own
+loop.
+
+Classes:
+    - DatabaseWriter: A queue of write intents served by a single writer task.
+
+Attributes:
+    writer (DatabaseWriter): The process-wide writer.
+
+Example:
+    # Start the writer once at startup
+    writer.start()
+
+    # Submit writes from handlers
+    await writer.update_data(table_name="all_users", data={"privacy": "Public"}, telegram_id=telegram_id)
+
+    # Apply queued writes and stop on shutdown
+    await writer.stop()
+"""
+
+
+import asyncio
+import logging
+
+from database.main import DatabaseManager
+from database.settings import WRITER_WINDOW, WRITER_MAX_BATCH
+
+
+class WriteIntent:
+    """
+    A write waiting in the writer queue.
+
+    Args:
+        method (str): Name of the DatabaseManager method applying the write.
+        kwargs (dict): Arguments of the method.
+        future (asyncio.Future): Future resolved with the method result once the write is committed.
+    """
+    __slots__ = ("method", "kwargs", "future")
+
+    def __init__(self, method: str, kwargs: dict, future: asyncio.Future):
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+
+
+class DatabaseWriter:
+    """
+    A queue of write intents served by a single writer task.
+
+    Args:
+        window (float): Seconds to wait for more intents after the first one of a transaction arrives.
+        max_batch (int): Maximum amount of intents applied in one transaction.
+    """
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self._stopping = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts the writer task in the running event loop"""
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Applies every queued intent and stops the writer task. Writes submitted while stopping are applied
+        directly"""
+        if not self.is_running:
+            return
+
+        self._stopping = True
+        self._queue.put_nowait(None)
+        try:
+            await self._task
+        except Exception as e:
+            logging.error(msg=f"An error occurred during stopping of the writer: {e}")
+
+        # Intents the writer task has not taken, e.g. because it failed, are applied or failed here
+        leftover = []
+        while not self._queue.empty():
+            intent = self._queue.get_nowait()
+            if intent is not None:
+                leftover.append(intent)
+        if leftover:
+            await self._write(leftover)
+
+        self._task = None
+        self._stopping = False
+
+    async def submit(self, method: str, **kwargs):
+        """Submits write and waits until it is committed. Returns the result of the DatabaseManager method"""
+        if not self.is_running or self._stopping:
+            async with DatabaseManager() as db:
+                return await getattr(db, method)(**kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(WriteIntent(method=method, kwargs=kwargs, future=future))
+        return await future
+
+    async def insert_data(self, table_name: str, data: dict):
+        """Submits DatabaseManager.insert_data, returns id of the inserted row"""
+        return await self.submit("insert_data", table_name=table_name, data=data)
+
+    async def update_data(self, table_name: str, data: dict, telegram_id: int):
+        """Submits DatabaseManager.update_data"""
+        return await self.submit("update_data", table_name=table_name, data=data, telegram_id=telegram_id)
+
+    async def delete_user_from_db(self, table_name: str, telegram_id: int):
+        """Submits DatabaseManager.delete_user_from_db"""
+        return await self.submit("delete_user_from_db", table_name=table_name, telegram_id=telegram_id)
+
+    async def set_deadline(self, telegram_id: int, kind: str, due_at: str):
+        """Submits DatabaseManager.set_deadline"""
+        return await self.submit("set_deadline", telegram_id=telegram_id, kind=kind, due_at=due_at)
+
+    async def _run(self):
+        """Collects intents arriving within the window and writes them in one transaction until stopped"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            intent = await self._queue.get()
+            if intent is None:
+                break
+
+            batch = [intent]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    if self._queue.empty():
+                        intent = await asyncio.wait_for(self._queue.get(), timeout=deadline - loop.time())
+                    else:
+                        intent = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+
+                if intent is None:
+                    stopping = True
+                    break
+
+                batch.append(intent)
+
+            await self._write(batch)
+
+    async def _write(self, batch: list):
+        """Applies intents in one transaction and resolves their futures after commit"""
+        results = []
+        try:
+            async with DatabaseManager() as db:
+                async with db.transaction():
+                    for intent in batch:
+                        try:
+                            async with db.transaction():
+                                result = await getattr(db, intent.method)(**intent.kwargs)
+                            results.append((intent, result, None))
+
+                        except Exception as e:
+                            results.append((intent, None, e))
+
+        except Exception as e:
+            logging.error(msg=f"An error occurred during writing {len(batch)} queued writes: {e}")
+            results = [(intent, None, e) for intent in batch]
+
+        for intent, result, error in results:
+            if intent.future.done():
+                continue
+
+            if error is None:
+                intent.future.set_result(result)
+            else:
+                intent.future.set_exception(error)
+
+
+writer = DatabaseWriter(window=WRITER_WINDOW, max_batch=WRITER_MAX_BATCH)
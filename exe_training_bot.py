@@ -2,15 +2,56 @@
 
 
 import asyncio
+import logging
 
 from bot.handlers import exe_bot
+from bot.jobs import job_queue
+from bot.main import storage
 from welcome_bot.handlers import exe_welcome_bot
-from bot.functions import make_notifications
+from welcome_bot.main import storage as welcome_storage
+from bot.notifications import schedule_notification_shards, admin_alerts
+from bot.settings import ADMIN_ALERTS_MODE, ADMIN_SUMMARY_INTERVAL
+from bot.scheduler import scheduler, IntervalJob
+from datetime import timedelta
+from database.main import DatabaseManager
+from database.pool import pool
+from database.settings import DB_NAME, POOL_SIZE
+from database.writer import writer
 
 
 async def start_program():
     """Starts whole program"""
-    await asyncio.gather(exe_bot(), make_notifications(), exe_welcome_bot())
+    pool.configure(db_name=DB_NAME, size=POOL_SIZE)
+    writer.start()
+    try:
+        # Notification jobs are planned from the users' time zones, so the schema has to be up to date first
+        async with DatabaseManager() as db:
+            applied_migrations = await db.migrate()
+            profile = await db.get_performance_profile()
+            await db.load_program_catalogue()
+            await db.load_role_catalogue()
+
+        logging.info(msg=f"Database migrations applied: {applied_migrations}")
+        logging.info(msg=f"Database performance profile: {profile}")
+
+        # Jobs left over by the previous run, e.g. after a crash, are run as soon as the queue starts
+        job_queue.start()
+        await schedule_notification_shards()
+        scheduler.add_job(IntervalJob(name="notification_shards", func=schedule_notification_shards,
+                                      interval=timedelta(hours=1)))
+        if ADMIN_ALERTS_MODE == "summary":
+            scheduler.add_job(IntervalJob(name="admin_alerts_summary", func=admin_alerts.send_summary,
+                                          interval=ADMIN_SUMMARY_INTERVAL))
+
+        await asyncio.gather(exe_bot(), scheduler.run(), exe_welcome_bot())
+    finally:
+        # Interrupted jobs are returned to the queue while the writer is still running
+        await job_queue.stop()
+        # Conversation states changed since the last flush are written before the writer stops
+        await storage.close()
+        await welcome_storage.close()
+        await writer.stop()
+        await pool.close()
 
 
 if __name__ == "__main__":
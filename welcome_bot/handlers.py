@@ -2,10 +2,12 @@ from aiogram.types import Message
 from welcome_bot.main import dp, bot
 from aiogram.fsm.context import FSMContext
 from welcome_bot.states import SubscriberState
+from database.cache import program_catalogue
 from database.main import DatabaseManager
 import re
 import welcome_bot.texts as texts
 from bot.functions import create_small_group
+from bot.notifications import format_deadline
 from go_high_level.api_calls import create_user, create_opportunity
 from datetime import datetime
 import logging
@@ -15,12 +17,29 @@ logging.basicConfig(filename='logs.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+async def answer_registered_user(message: Message, user_context):
+    """Answers a user who is already registered with a link to the user's training group"""
+    group_link = f'<a href="{user_context.group["group_invite_link"]}">training group</a>'
+
+    await message.answer(text=texts.already_registered.format(user_context.user["first_name"],
+                                                              group_link),
+                         disable_web_page_preview=True)
+
+
 @dp.message(SubscriberState.verifying_email)
 async def handle_email_verifications(message: Message, state: FSMContext):
     try:
         email_pattern = "^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
         if re.match(pattern=email_pattern, string=message.text):
-            async with DatabaseManager("test.db") as db:
+            async with DatabaseManager() as db:
+                # A registered user is answered before the small group, the GoHighLevel contact and the opportunity
+                # are created, since the insert of a second record would be rejected only after them
+                user_context = await db.get_user_context(telegram_id=message.from_user.id)
+                if user_context:
+                    await answer_registered_user(message=message, user_context=user_context)
+                    await state.clear()
+                    return
+
                 user_email = message.text.lower()
                 parameters = {"column": "email",
                               "value": user_email}
@@ -28,12 +47,7 @@ async def handle_email_verifications(message: Message, state: FSMContext):
                                                          parameters=parameters)
                 if verified_user:
                     user_program_title = verified_user["program_title"]
-                    program_query = f"""SELECT * FROM programs 
-                                                 WHERE program_name = '{user_program_title}' 
-                                     """
-
-                    programs = await db.custom_query(query=program_query)
-                    user_program = programs[0]
+                    user_program = program_catalogue.get_by_name(user_program_title)
                     user_program_id = user_program["id"]
                     program_pipeline_id = user_program["ghl_pipeline_id"]
                     default_stage_id = user_program["ghl_students_id"]
@@ -78,6 +92,9 @@ async def handle_email_verifications(message: Message, state: FSMContext):
 
                     await db.insert_data(table_name="all_users",
                                          data=user_data)
+                    # The new user is due for the next practice reminder
+                    await db.set_deadline(telegram_id=message.from_user.id, kind="practice",
+                                          due_at=format_deadline(datetime.now()))
                     main_group_link = f'<a href="{group_invite_link}">Program main group</a>'
 
                     text = texts.greeting_for_verified_user.format(main_group_link,
@@ -99,22 +116,11 @@ async def handle_email_verifications(message: Message, state: FSMContext):
 @dp.message()
 async def greeting_handler(message: Message, state: FSMContext):
     """Greeting for user and asking about registered email"""
-    async with DatabaseManager("test.db") as db:
-        parameters = {"column": "telegram_id",
-                      "value": message.from_user.id}
-        registered_user = await db.check_existence(table_name="all_users",
-                                                   parameters=parameters)
-        if registered_user:
-            query = f"""SELECT * FROM groups WHERE group_id = {registered_user['main_group_id']}"""
-            groups = await db.custom_query(query)
-            user_group = groups[0]
-
-    if registered_user:
-        group_link = f'<a href="{user_group["group_invite_link"]}">training group</a>'
-
-        await message.answer(text=texts.already_registered.format(registered_user["first_name"],
-                                                                  group_link),
-                             disable_web_page_preview=True)
+    async with DatabaseManager() as db:
+        user_context = await db.get_user_context(telegram_id=message.from_user.id)
+
+    if user_context:
+        await answer_registered_user(message=message, user_context=user_context)
 
     else:
         user_name = message.from_user.first_name
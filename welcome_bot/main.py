@@ -8,7 +8,7 @@ variable in the 'welcome_bot.settings' module.
 Components:
     - bot: An instance of the Telegram bot.
     - dp: The dispatcher for handling incoming messages and interactions.
-    - storage: Memory storage used by the dispatcher.
+    - storage: Storage used by the dispatcher, keeping conversation states in the database.
 
 Note:
     Ensure that the 'TOKEN' variable in the 'welcome_bot.settings' module contains a valid Telegram bot token
@@ -19,9 +19,9 @@ Example:
     from aiogram import Bot, Dispatcher
     from welcome_bot.settings import TOKEN
     from aiogram.enums import ParseMode
-    from aiogram.fsm.storage.memory import MemoryStorage
+    from database.fsm_storage import SQLiteStorage
 
-    storage = MemoryStorage()
+    storage = SQLiteStorage()
     bot = Bot(token=TOKEN, parse_mode=ParseMode.HTML)
     dp = Dispatcher(storage=storage)
 """
@@ -30,8 +30,8 @@ Example:
 from aiogram import Bot, Dispatcher
 from welcome_bot.settings import TOKEN
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from database.fsm_storage import SQLiteStorage
 
-storage = MemoryStorage()
+storage = SQLiteStorage()
 bot = Bot(token=TOKEN, parse_mode=ParseMode.HTML)
 dp = Dispatcher(storage=storage)